@@ -0,0 +1,297 @@
+# alert_dispatcher.py
+# Turns risk-band transitions into notifications. Scoring only enqueues
+# transitions; per-channel worker threads batch them, apply rate limits and
+# retries, and hand them to pluggable sinks (file outbox, webhook, ...).
+
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+
+from controlmodule import RESOURCES, risk_band
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTBOX_DIR = os.path.join(BASE_DIR, "alert_outbox")
+
+BAND_ORDER = ["low", "medium", "high", "critical"]
+
+# Which bands each channel notifies about (on entering the band)
+CHANNEL_BANDS = {
+    "sms": {"critical"},
+    "email": {"high", "critical"},
+    "webhook": {"low", "medium", "high", "critical"},
+}
+
+# A location that re-enters the critical band within this window (e.g. it
+# flaps critical -> high -> critical) does not send a second critical alert.
+CRITICAL_DEDUP_SECONDS = 15 * 60
+
+QUEUE_SIZE = 20000
+BATCH_SIZE = 100
+BATCH_WAIT_SECONDS = 0.5
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.5
+
+# Batches per second allowed for each channel
+CHANNEL_RATE_LIMITS = {
+    "sms": 2.0,
+    "email": 5.0,
+    "webhook": 10.0,
+}
+
+
+# --- Sinks ---
+class FileSink:
+    """Appends each notification as a JSON line to a file (local stand-in for a provider)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        lines = "".join(json.dumps(n) + "\n" for n in batch)
+        # Created on first write, so building a pipeline leaves no files behind
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+class WebhookSink:
+    """POSTs each batch as a JSON array to a webhook URL."""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, batch):
+        body = json.dumps({"alerts": batch}).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"Webhook returned status {response.status}")
+
+
+def default_sinks():
+    """File outboxes for every channel; the webhook goes to ALERT_WEBHOOK_URL if set."""
+    sinks = {channel: FileSink(os.path.join(OUTBOX_DIR, f"{channel}.jsonl")) for channel in CHANNEL_BANDS}
+    webhook_url = os.environ.get("ALERT_WEBHOOK_URL")
+    if webhook_url:
+        sinks["webhook"] = WebhookSink(webhook_url)
+    return sinks
+
+
+# --- Rate Limiting ---
+class RateLimiter:
+    """Token bucket that blocks until a token is available."""
+
+    def __init__(self, rate_per_second, burst=1):
+        self.rate = rate_per_second
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# --- Pipeline ---
+class AlertPipeline:
+    """
+    Watches per-location risk bands and dispatches notifications on changes.
+
+    `observe()` is cheap and never blocks: it compares the new band with the
+    last one seen for the location and enqueues a notification for each
+    channel interested in the new band. Staying in the same band sends
+    nothing. Each channel has its own queue, rate limiter and workers.
+    """
+
+    def __init__(self, sinks=None, workers_per_channel=2, rate_limits=None,
+                 batch_size=BATCH_SIZE, max_retries=MAX_RETRIES):
+        self.sinks = default_sinks() if sinks is None else sinks
+        self.workers_per_channel = workers_per_channel
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        rate_limits = CHANNEL_RATE_LIMITS if rate_limits is None else rate_limits
+
+        self._bands = {}
+        self._last_critical = {}
+        self._state_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._queues = {channel: queue.Queue(maxsize=QUEUE_SIZE) for channel in self.sinks}
+        self._limiters = {
+            channel: RateLimiter(rate_limits.get(channel, 1.0), burst=workers_per_channel)
+            for channel in self.sinks
+        }
+        self._threads = []
+        self._stop = threading.Event()
+        self.stats = {channel: {"sent": 0, "failed": 0, "dropped": 0} for channel in self.sinks}
+        self.dead_letters = []
+
+    def start(self):
+        if self._threads:
+            return
+        for channel in self.sinks:
+            for i in range(self.workers_per_channel):
+                thread = threading.Thread(target=self._worker, args=(channel,),
+                                          name=f"alert-{channel}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, drain=True):
+        """Stops the workers, optionally after the queues are empty."""
+        if drain:
+            for q in self._queues.values():
+                q.join()
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._stop.clear()
+
+    def observe(self, location_id, risk_score, now=None):
+        """Records a new score for a location; returns the transition if there was one."""
+        now = time.time() if now is None else now
+        band = risk_band(risk_score)
+
+        with self._state_lock:
+            previous = self._bands.get(location_id)
+            if band == previous:
+                return None
+            self._bands[location_id] = band
+
+            if band == "critical":
+                # Only an alert that is actually sent restarts the dedup window
+                last = self._last_critical.get(location_id)
+                if last is not None and now - last < CRITICAL_DEDUP_SECONDS:
+                    return None
+                self._last_critical[location_id] = now
+
+        # The first observation of a quiet location is not news
+        if previous is None and band == "low":
+            return None
+
+        notification = self._build_notification(location_id, previous, band, risk_score, now)
+        for channel, q in self._queues.items():
+            if band not in CHANNEL_BANDS.get(channel, set()):
+                continue
+            try:
+                q.put_nowait(notification)
+            except queue.Full:
+                with self._stats_lock:
+                    self.stats[channel]["dropped"] += 1
+        return notification
+
+    def observe_many(self, scores, now=None):
+        """Observes a {location_id: risk_score} mapping; returns the transitions."""
+        transitions = []
+        for location_id, risk_score in scores.items():
+            notification = self.observe(location_id, risk_score, now)
+            if notification is not None:
+                transitions.append(notification)
+        return transitions
+
+    def _build_notification(self, location_id, previous, band, risk_score, now):
+        resources = RESOURCES.get(location_id, {})
+        name = resources.get("name", location_id)
+        rising = previous is None or BAND_ORDER.index(band) > BAND_ORDER.index(previous)
+        if band == "critical":
+            message = f"Severe Flood Alert for {name}. Move to higher ground and avoid low-lying roads."
+        elif band == "high" and rising:
+            message = f"Flood Watch for {name}. Stay alert for further updates."
+        elif rising:
+            message = f"Flood risk in {name} has risen to {band}."
+        else:
+            message = f"Flood risk in {name} has eased to {band}."
+        return {
+            "location_id": location_id,
+            "name": name,
+            "band": band,
+            "previous_band": previous,
+            "risk_score": round(float(risk_score), 4),
+            "timestamp": now,
+            "message": message,
+            "authority_contact": resources.get("authority_contact"),
+        }
+
+    def _next_batch(self, q):
+        """Waits for one item, then collects whatever else is ready up to the batch size."""
+        try:
+            batch = [q.get(timeout=BATCH_WAIT_SECONDS)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self, channel):
+        q = self._queues[channel]
+        sink = self.sinks[channel]
+        limiter = self._limiters[channel]
+        while not self._stop.is_set():
+            batch = self._next_batch(q)
+            if not batch:
+                continue
+            try:
+                self._send(channel, sink, limiter, batch)
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+    def _send(self, channel, sink, limiter, batch):
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            try:
+                sink(batch)
+                with self._stats_lock:
+                    self.stats[channel]["sent"] += len(batch)
+                return
+            except Exception as e:
+                print(f"[ALERT] {channel} delivery failed (attempt {attempt + 1}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(RETRY_BACKOFF_SECONDS * (2 ** attempt))
+        with self._stats_lock:
+            self.stats[channel]["failed"] += len(batch)
+            self.dead_letters.append({"channel": channel, "alerts": batch})
+
+
+if __name__ == "__main__":
+    # Citywide storm drill: thousands of locations go critical at once
+    import random
+    import tempfile
+
+    N_LOCATIONS = 5000
+    outbox = tempfile.mkdtemp(prefix="alert_drill_")
+    sinks = {channel: FileSink(os.path.join(outbox, f"{channel}.jsonl")) for channel in CHANNEL_BANDS}
+    pipeline = AlertPipeline(sinks=sinks, rate_limits={c: 50.0 for c in CHANNEL_BANDS})
+    pipeline.start()
+
+    rng = random.Random(42)
+    pipeline.observe_many({f"loc_{i}": rng.uniform(0.0, 0.4) for i in range(N_LOCATIONS)})
+
+    start = time.perf_counter()
+    transitions = pipeline.observe_many({f"loc_{i}": rng.uniform(0.81, 1.0) for i in range(N_LOCATIONS)})
+    enqueue_ms = (time.perf_counter() - start) * 1000
+    repeats = pipeline.observe_many({f"loc_{i}": rng.uniform(0.81, 1.0) for i in range(N_LOCATIONS)})
+    pipeline.stop(drain=True)
+    total_s = time.perf_counter() - start
+
+    print(f"Transitions: {len(transitions)} (repeated critical readings deduplicated: {len(repeats) == 0})")
+    print(f"Enqueue time: {enqueue_ms:.1f} ms | Delivered in {total_s:.2f} s")
+    print(f"Stats: {pipeline.stats}")
+    print(f"Outbox: {outbox}")
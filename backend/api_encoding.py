@@ -0,0 +1,110 @@
+# api_encoding.py
+# Fast JSON encoding and content-encoding negotiation for API responses.
+# Encoded bodies are cached per snapshot version, and each compressed variant
+# is produced at most once per version.
+
+import gzip
+import json
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# --- Configuration ---
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+# Server preference when the client accepts several encodings equally
+COMPRESSORS = {}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+if zstandard is not None:
+    COMPRESSORS["zstd"] = lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+COMPRESSORS["gzip"] = lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def dumps(payload):
+    """Serializes a payload to compact JSON bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def negotiate_encoding(accept_encoding):
+    """Picks the best supported encoding from an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in COMPRESSORS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class EncodedSnapshotCache:
+    """
+    Keeps the encoded body of the latest snapshot for each named payload.
+
+    `get()` returns cached bytes while the version is unchanged; the payload
+    is only built (via the supplied callable) and serialized when the version
+    moves on. Compressed variants are added lazily as clients ask for them.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, version, build_payload, encoding=None):
+        """Returns (body bytes, applied encoding or None)."""
+        with self._lock:
+            entry = self._entries.get(name)
+            identity = entry["bodies"][None] if entry is not None and entry["version"] == version else None
+
+        if identity is None:
+            # Building can mean re-scoring every node, so it runs outside the lock
+            identity = dumps(build_payload())
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is None or entry["version"] != version:
+                    entry = {"version": version, "bodies": {None: identity}}
+                    self._entries[name] = entry
+
+        if encoding is None or len(identity) < MIN_COMPRESS_BYTES:
+            return identity, None
+        with self._lock:
+            body = entry["bodies"].get(encoding)
+        if body is None:
+            body = COMPRESSORS[encoding](identity)
+            with self._lock:
+                entry["bodies"][encoding] = body
+        return body, encoding
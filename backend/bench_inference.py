@@ -0,0 +1,255 @@
+# bench_inference.py
+# Benchmark and regression check for model serving. Measures model load time,
+# single-row and batched predict_proba latency, /status end-to-end latency at
+# several node counts (both re-scored and served from cache), and memory.
+# Everything runs in-process (Flask test client, no network). Results are
+# saved as JSON and can be compared against a previous run; the script exits
+# non-zero if p95 latency or memory regress beyond the allowed thresholds
+# (cache-hit timings are reported but not gated).
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import joblib
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "rf_flood_model.joblib")
+
+LOAD_REPEATS = 5
+SINGLE_ROW_REPEATS = 200
+BATCH_SIZES = [10, 100, 1000]
+BATCH_REPEATS = 20
+STATUS_NODE_COUNTS = [10, 100, 500]
+STATUS_REPEATS = 10
+
+DEFAULT_MAX_LATENCY_REGRESSION = 0.20  # 20% slower p95 fails the run
+DEFAULT_MAX_MEMORY_REGRESSION = 0.20
+# A p95 this close to the baseline is timer noise, whatever the percentage
+MIN_LATENCY_REGRESSION_MS = 1.0
+# Cache hits are sub-millisecond, so they are reported but never gated
+UNGATED_SUFFIX = "_cached"
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, "bench_results.json")
+RANDOM_SEED = 42
+
+
+def summarize(samples_s):
+    """Summarizes a list of durations (seconds) as milliseconds."""
+    ms = np.asarray(samples_s) * 1000.0
+    return {
+        "n": int(ms.size),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def random_features(model_features, n_rows, rng):
+    """Builds plausible rainfall feature rows (same columns as the server)."""
+    rain = rng.gamma(shape=0.6, scale=12.0, size=(n_rows, 7))
+    days = rng.integers(1, 366, size=n_rows)
+    rows = {f"lag_{i}": rain[:, -1 - i] for i in range(1, 7)}
+    rows["sum_3d"] = rain[:, -3:].sum(axis=1)
+    rows["sum_6d"] = rain[:, -6:].sum(axis=1)
+    rows["dayofyear"] = days
+    rows["month"] = pd.to_datetime(days - 1, unit="D", origin="2025-01-01").month
+    return pd.DataFrame(rows)[model_features]
+
+
+# --- Benchmarks ---
+def bench_model_load():
+    return summarize(timed(lambda: joblib.load(MODEL_PATH), LOAD_REPEATS))
+
+
+def bench_predict(model, model_features, rng):
+    single = random_features(model_features, 1, rng)
+    results = {"single_row": summarize(timed(lambda: model.predict_proba(single), SINGLE_ROW_REPEATS))}
+    for size in BATCH_SIZES:
+        batch = random_features(model_features, size, rng)
+        stats = summarize(timed(lambda: model.predict_proba(batch), BATCH_REPEATS))
+        stats["per_row_us"] = stats["mean_ms"] * 1000.0 / size
+        results[f"batch_{size}"] = stats
+    return results
+
+
+def bench_status(rng):
+    """Times GET /status through the Flask test client at several node counts."""
+    # Scoring is timed on request only, not by the server's background thread
+    os.environ["BACKGROUND_SCORING"] = "0"
+    with contextlib.redirect_stdout(io.StringIO()):
+        import server
+    from alert_dispatcher import CHANNEL_BANDS, AlertPipeline
+    from drainage_network import DrainageNetwork
+    from ingest import SensorIngest
+
+    # Band changes while scoring must not write to the outbox or call a real webhook
+    server.alert_pipeline.stop(drain=False)
+    server.alert_pipeline = AlertPipeline(sinks={channel: (lambda batch: None) for channel in CHANNEL_BANDS})
+    server.alert_pipeline.start()
+    client = server.app.test_client()
+
+    results = {}
+    for n_nodes in STATUS_NODE_COUNTS:
+        server.sensor_live_data.clear()
+        server.sensor_histories.clear()
+        server.node_versions.clear()
+        server.sensor_ingest = SensorIngest()
+        server.edge_results.clear()
+        server.edge_gateways.clear()
+        server.drainage_network = DrainageNetwork.from_resources()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(n_nodes):
+                for rain in rng.gamma(shape=0.6, scale=12.0, size=7):
+                    client.post("/data", json={
+                        "node_id": f"bench_node_{i}",
+                        "lat": 12.9 + rng.random() * 0.2,
+                        "lon": 80.1 + rng.random() * 0.2,
+                        "rainfall_mm_hr": float(rain),
+                        "water_level_cm": float(rain),
+                    })
+
+            def call():
+                response = client.get("/status")
+                assert response.status_code == 200, response.status_code
+
+            def call_uncached():
+                # /status is cached per data version and nodes keep their score until they
+                # get a new reading; bumping the version and dropping the scores re-scores all
+                server.data_version += 1
+                server.node_scores.clear()
+                call()
+
+            call_uncached()  # warm-up
+            samples = timed(call_uncached, STATUS_REPEATS)
+            cached_samples = timed(call, STATUS_REPEATS)
+
+            # Allocation tracing slows calls down, so measure it on a separate call
+            tracemalloc.start()
+            call_uncached()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        stats = summarize(samples)
+        stats["peak_alloc_mb"] = peak / 1e6
+        results[f"nodes_{n_nodes}"] = stats
+        results[f"nodes_{n_nodes}_cached"] = summarize(cached_samples)
+    return results
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return rss / 1e6 if sys.platform == "darwin" else rss / 1e3
+
+
+def run_benchmarks():
+    rng = np.random.default_rng(RANDOM_SEED)
+    model_data = joblib.load(MODEL_PATH)
+    model, model_features = model_data["model"], model_data["features"]
+
+    return {
+        "meta": {
+            "timestamp": pd.Timestamp.now().isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "model_bytes": os.path.getsize(MODEL_PATH),
+        },
+        "model_load": bench_model_load(),
+        "predict_proba": bench_predict(model, model_features, rng),
+        "status": bench_status(rng),
+        "memory": {"max_rss_mb": max_rss_mb()},
+    }
+
+
+# --- Regression Check ---
+def compare(current, baseline, max_latency_regression, max_memory_regression):
+    """Returns a list of human-readable regressions (empty if none)."""
+    failures = []
+
+    def check(label, new, old, limit, floor=0.0):
+        if old and new is not None and new > old * (1.0 + limit) and new - old > floor:
+            failures.append(f"{label}: {old:.2f} -> {new:.2f} (+{(new / old - 1.0) * 100:.0f}%, limit {limit * 100:.0f}%)")
+
+    check("model_load p95_ms", current["model_load"]["p95_ms"],
+          baseline.get("model_load", {}).get("p95_ms"), max_latency_regression, MIN_LATENCY_REGRESSION_MS)
+    for section in ("predict_proba", "status"):
+        for name, stats in current[section].items():
+            if name.endswith(UNGATED_SUFFIX):
+                continue
+            old = baseline.get(section, {}).get(name, {})
+            check(f"{section}.{name} p95_ms", stats["p95_ms"], old.get("p95_ms"),
+                  max_latency_regression, MIN_LATENCY_REGRESSION_MS)
+            if "peak_alloc_mb" in stats:
+                check(f"{section}.{name} peak_alloc_mb", stats["peak_alloc_mb"],
+                      old.get("peak_alloc_mb"), max_memory_regression)
+    check("memory max_rss_mb", current["memory"]["max_rss_mb"],
+          baseline.get("memory", {}).get("max_rss_mb"), max_memory_regression)
+    return failures
+
+
+def print_results(results):
+    print(f"Model load:        p95 {results['model_load']['p95_ms']:8.2f} ms")
+    for name, stats in results["predict_proba"].items():
+        print(f"predict_proba {name:<12} p95 {stats['p95_ms']:8.2f} ms")
+    for name, stats in results["status"].items():
+        line = f"/status {name:<18} p95 {stats['p95_ms']:8.2f} ms"
+        if "peak_alloc_mb" in stats:
+            line += f" | peak alloc {stats['peak_alloc_mb']:.1f} MB"
+        if name.endswith(UNGATED_SUFFIX):
+            line += " (not gated)"
+        print(line)
+    if results["memory"]["max_rss_mb"] is not None:
+        print(f"Max RSS:           {results['memory']['max_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark model serving and check for regressions.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to save this run")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--max-latency-regression", type=float, default=DEFAULT_MAX_LATENCY_REGRESSION)
+    parser.add_argument("--max-memory-regression", type=float, default=DEFAULT_MAX_MEMORY_REGRESSION)
+    args = parser.parse_args()
+
+    results = run_benchmarks()
+    print_results(results)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.max_latency_regression, args.max_memory_regression)
+        if failures:
+            print("REGRESSION DETECTED:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}.")
@@ -0,0 +1,89 @@
+# bench_serialization.py
+# Compares /status payload size and encode time for Flask's stdlib JSON
+# encoding versus api_encoding.dumps, with and without each compression,
+# at 1k and 10k nodes. Runs offline on synthetic payloads.
+
+import json
+import random
+import time
+
+from api_encoding import COMPRESSORS, EncodedSnapshotCache, dumps, orjson
+
+# --- Configuration ---
+NODE_COUNTS = [1_000, 10_000]
+REPEATS = 5
+RANDOM_SEED = 42
+
+
+def build_status_payload(n_nodes, rng):
+    """Builds a payload shaped like the /status response."""
+    payload = {}
+    for i in range(n_nodes):
+        node_id = f"chennai_node_{i:05d}"
+        rain = round(rng.uniform(0, 65), 2)
+        risk = rng.random()
+        payload[node_id] = {
+            "live_data": {
+                "node_id": node_id,
+                "lat": 12.75 + rng.random() * 0.5,
+                "lon": 79.8 + rng.random() * 0.7,
+                "rainfall_mm_hr": rain,
+                "water_level_cm": round(rain * rng.uniform(0.5, 1.5), 2),
+                "flow_rate_lps": round(rain * rng.uniform(2, 5), 2),
+            },
+            "prediction": int(risk > 0.5),
+            "risk_score": risk,
+            "history": [round(rng.uniform(0, 65), 2) for _ in range(7)],
+            "network": {
+                "local_water_level": rain,
+                "local_risk": risk,
+                "network_water_level": rain * 1.2,
+                "network_risk": risk,
+                "upstream": [],
+                "downstream": [f"chennai_node_{(i + 1) % n_nodes:05d}"],
+            },
+        }
+    return payload
+
+
+def best_of(fn):
+    best = float("inf")
+    result = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0, result
+
+
+def flask_style_dumps(payload):
+    # What Flask's default JSON provider does for jsonify() outside debug mode
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+if __name__ == "__main__":
+    rng = random.Random(RANDOM_SEED)
+    fast_name = "orjson" if orjson is not None else "json (orjson not installed)"
+
+    for n_nodes in NODE_COUNTS:
+        payload = build_status_payload(n_nodes, rng)
+        print(f"\n--- {n_nodes} nodes ---")
+        print(f"{'encoder':<32} | {'encode ms':>9} | {'bytes':>10}")
+        print("-" * 58)
+
+        baseline_ms, baseline_body = best_of(lambda: flask_style_dumps(payload))
+        print(f"{'jsonify (stdlib json)':<32} | {baseline_ms:>9.2f} | {len(baseline_body):>10}")
+        fast_ms, body = best_of(lambda: dumps(payload))
+        print(f"{fast_name:<32} | {fast_ms:>9.2f} | {len(body):>10}")
+
+        for encoding, compress in COMPRESSORS.items():
+            compress_ms, compressed = best_of(lambda: compress(body))
+            label = f"{fast_name.split()[0]} + {encoding}"
+            print(f"{label:<32} | {fast_ms + compress_ms:>9.2f} | {len(compressed):>10}")
+
+        # Repeated requests for the same snapshot are served from the cache
+        cache = EncodedSnapshotCache()
+        cache.get("status", 1, lambda: payload, "gzip")
+        hit_ms, _ = best_of(lambda: cache.get("status", 1, lambda: payload, "gzip"))
+        print(f"{'cached snapshot (gzip)':<32} | {hit_ms:>9.4f} | {'-':>10}")
+        print(f"Encode speedup vs jsonify: {baseline_ms / fast_ms:.1f}x")
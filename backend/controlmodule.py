@@ -16,6 +16,16 @@ def load_resources():
 
 RESOURCES = load_resources()
 
+def risk_band(risk_score):
+    """Maps a risk score to the band used by the control rules below."""
+    if risk_score > 0.8:
+        return "critical"
+    elif risk_score > 0.6:
+        return "high"
+    elif risk_score > 0.4:
+        return "medium"
+    return "low"
+
 def generate_control_strategies(location_id, risk_score):
     """Generates control strategies based on location and risk score."""
     
@@ -0,0 +1,149 @@
+# drainage_network.py
+# Models the drainage network as a directed graph so that water level and risk
+# at upstream locations propagate to the locations they drain into.
+
+import heapq
+import threading
+
+from controlmodule import RESOURCES
+
+# Changes smaller than this are not propagated any further downstream
+PROPAGATION_TOLERANCE = 1e-6
+
+
+class DrainageNetwork:
+    """
+    Directed acyclic graph of drainage locations.
+
+    Each node keeps its own (local) water level and risk. The effective values
+    add what flows in from upstream nodes, scaled by each channel's transfer
+    coefficient:
+
+        level(v) = local_level(v) + sum(transfer(u, v) * level(u))
+        risk(v)  = max(local_risk(v), max(transfer(u, v) * risk(u)))
+
+    Nodes are processed in topological order, and an update only walks the
+    downstream subgraph whose effective values actually change, so its cost
+    depends on the affected nodes rather than on the size of the network.
+    """
+
+    def __init__(self):
+        self._downstream = {}   # node -> [(child, transfer, channel)]
+        self._upstream = {}     # node -> [(parent, transfer)]
+        self._order = {}        # node -> topological index
+        self._local_level = {}
+        self._local_risk = {}
+        self._level = {}
+        self._risk = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_resources(cls, resources=None):
+        """Builds the network from the `drains_to` entries in resources.json."""
+        resources = RESOURCES if resources is None else resources
+        edges = []
+        for node_id, info in resources.items():
+            for link in info.get("drains_to", []):
+                edges.append((node_id, link["node"], float(link.get("transfer", 1.0)), link.get("channel")))
+        return cls.from_edges(resources.keys(), edges)
+
+    @classmethod
+    def from_edges(cls, nodes, edges):
+        """Builds the network from node ids and (upstream, downstream, transfer, channel) edges."""
+        network = cls()
+        for node_id in nodes:
+            network._add_node(node_id)
+        for upstream, downstream, transfer, channel in edges:
+            network._add_node(upstream)
+            network._add_node(downstream)
+            network._downstream[upstream].append((downstream, transfer, channel))
+            network._upstream[downstream].append((upstream, transfer))
+        network._sort()
+        return network
+
+    def _add_node(self, node_id):
+        if node_id in self._downstream:
+            return
+        self._downstream[node_id] = []
+        self._upstream[node_id] = []
+        self._order[node_id] = len(self._order)
+        self._local_level[node_id] = 0.0
+        self._local_risk[node_id] = 0.0
+        self._level[node_id] = 0.0
+        self._risk[node_id] = 0.0
+
+    def _sort(self):
+        """Assigns topological indices (Kahn's algorithm); raises on cycles."""
+        indegree = {n: len(parents) for n, parents in self._upstream.items()}
+        ready = [n for n, d in indegree.items() if d == 0]
+        order = {}
+        while ready:
+            node_id = ready.pop()
+            order[node_id] = len(order)
+            for child, _, _ in self._downstream[node_id]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        if len(order) != len(self._downstream):
+            cyclic = sorted(n for n in self._downstream if n not in order)
+            raise ValueError(f"Drainage network contains a cycle through: {', '.join(cyclic)}")
+        self._order = order
+
+    def __contains__(self, node_id):
+        return node_id in self._downstream
+
+    def __len__(self):
+        return len(self._downstream)
+
+    def update(self, node_id, water_level=None, risk=None):
+        """
+        Sets the local reading for a node and propagates the change downstream.
+
+        Unknown nodes are added as isolated nodes. Returns the list of node ids
+        whose effective level or risk changed, in topological order.
+        """
+        with self._lock:
+            if node_id not in self._downstream:
+                # An isolated node can go last without breaking the ordering
+                self._add_node(node_id)
+            if water_level is not None:
+                self._local_level[node_id] = float(water_level)
+            if risk is not None:
+                self._local_risk[node_id] = float(risk)
+
+            changed = []
+            heap = [(self._order[node_id], node_id)]
+            queued = {node_id}
+            while heap:
+                _, current = heapq.heappop(heap)
+                queued.discard(current)
+
+                level = self._local_level[current]
+                risk_value = self._local_risk[current]
+                for parent, transfer in self._upstream[current]:
+                    level += transfer * self._level[parent]
+                    risk_value = max(risk_value, transfer * self._risk[parent])
+
+                if (abs(level - self._level[current]) <= PROPAGATION_TOLERANCE
+                        and abs(risk_value - self._risk[current]) <= PROPAGATION_TOLERANCE):
+                    continue
+
+                self._level[current] = level
+                self._risk[current] = risk_value
+                changed.append(current)
+                for child, _, _ in self._downstream[current]:
+                    if child not in queued:
+                        queued.add(child)
+                        heapq.heappush(heap, (self._order[child], child))
+            return changed
+
+    def state(self, node_id):
+        """Returns the local and propagated values for a node."""
+        return {
+            "local_water_level": self._local_level.get(node_id, 0.0),
+            "local_risk": self._local_risk.get(node_id, 0.0),
+            "network_water_level": self._level.get(node_id, 0.0),
+            "network_risk": self._risk.get(node_id, 0.0),
+            "upstream": [parent for parent, _ in self._upstream.get(node_id, [])],
+            "downstream": [child for child, _, _ in self._downstream.get(node_id, [])],
+        }
@@ -0,0 +1,230 @@
+# edge_scorer.py
+# Lets the MQTT gateway score readings itself. The random forest is exported
+# to a compact .npz of flat numpy arrays (no scikit-learn/joblib needed on the
+# gateway), and EdgeScorer batches readings, scores them with that export or
+# the threshold scorer, and reports band changes and summaries.
+
+import argparse
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from controlmodule import risk_band
+from ingest import IngestError, SensorIngest
+from risk_scoring import calculate_threshold_risk, history_features, uses_threshold_logic
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "rf_flood_model.joblib")
+COMPACT_MODEL_PATH = os.path.join(BASE_DIR, "rf_flood_model_compact.npz")
+
+
+# --- Compact Model Export ---
+def export_compact_model(model_path=MODEL_PATH, out_path=COMPACT_MODEL_PATH):
+    """
+    Flattens every tree of the trained forest into shared node arrays.
+
+    Leaves point to themselves with an infinite threshold, so traversal can
+    run a fixed number of steps without checking for leaves.
+    """
+    import joblib  # only needed where the export is made
+
+    model_data = joblib.load(model_path)
+    forest = model_data["model"]
+    positive = list(forest.classes_).index(1)
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        index = np.arange(n) + offset
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int16))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float32))
+        lefts.append(np.where(is_leaf, index, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, index, tree.children_right + offset).astype(np.int32))
+        counts = tree.value[:, 0, :]
+        values.append((counts[:, positive] / counts.sum(axis=1)).astype(np.float32))
+        roots.append(offset)
+
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    np.savez_compressed(
+        out_path,
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=np.array(max_depth),
+        feature_names=np.array(model_data["features"]),
+    )
+    return out_path
+
+
+class CompactForest:
+    """Numpy-only predict_proba for a forest exported by export_compact_model()."""
+
+    def __init__(self, path=COMPACT_MODEL_PATH):
+        with np.load(path) as data:
+            self.feature = data["feature"]
+            self.threshold = data["threshold"]
+            self.left = data["left"]
+            self.right = data["right"]
+            self.value = data["value"]
+            self.roots = data["roots"]
+            self.max_depth = int(data["max_depth"])
+            self.features = [str(name) for name in data["feature_names"]]
+
+    def predict_proba(self, X):
+        """Returns the flood probability for each row of X (rows x features)."""
+        # Same float32 comparison as scikit-learn's tree traversal
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.roots.size))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes].mean(axis=1)
+
+
+# --- Edge Scoring ---
+class EdgeScorer:
+    """
+    Keeps per-node rainfall histories on the gateway and scores them in batches.
+
+    `add()` passes a reading through the same ingest stage as the server
+    (validation, de-duplication, spike handling) and buffers it. `flush()`
+    scores every node that received readings since the last flush in one
+    batch and returns the per-node results plus every band change not yet
+    confirmed upstream; call `mark_sent()` with the changes once the server
+    has accepted them, so a failed send is retried on the next flush.
+    """
+
+    def __init__(self, forest, ingest=None):
+        self.forest = forest
+        self.ingest = SensorIngest() if ingest is None else ingest
+        self._histories = defaultdict(lambda: deque([0.0] * 7, maxlen=7))
+        self._live_data = {}
+        self._pending = set()
+        self._bands = {}
+        self._unsent = {}  # node_id -> latest band change the server has not acknowledged
+        self._lock = threading.Lock()
+
+    def add(self, reading):
+        with self._lock:
+            try:
+                record = self.ingest.accept(reading)
+            except IngestError as e:
+                print(f"[EDGE] Dropping invalid reading: {e}")
+                return False
+            if record is None:
+                # Duplicate or out-of-order reading (e.g. an MQTT redelivery)
+                return False
+
+            node_id = record["node_id"]
+            history = self._histories[node_id]
+            if "replaces_previous" in record:
+                # The previous reading turned out to be an isolated spike
+                history[-1] = record["replaces_previous"]
+            history.append(record["rainfall_mm_hr"])
+            self._live_data[node_id] = record
+            self._pending.add(node_id)
+        return True
+
+    def flush(self):
+        with self._lock:
+            pending = sorted(self._pending)
+            self._pending.clear()
+            snapshot = {
+                node_id: (dict(self._live_data[node_id]), list(self._histories[node_id]))
+                for node_id in pending
+            }
+
+        results = {}
+        model_nodes = []
+        rows = []
+        for node_id, (live_data, history) in snapshot.items():
+            if uses_threshold_logic(node_id):
+                risk_score = calculate_threshold_risk(
+                    live_data.get("water_level_cm") or 0.0, live_data["rainfall_mm_hr"])
+                results[node_id] = {"live_data": live_data, "risk_score": risk_score, "history": history}
+            else:
+                features = history_features(history)
+                model_nodes.append(node_id)
+                rows.append([features[name] for name in self.forest.features])
+
+        if rows:
+            probabilities = self.forest.predict_proba(rows)
+            for node_id, probability in zip(model_nodes, probabilities):
+                live_data, history = snapshot[node_id]
+                results[node_id] = {"live_data": live_data, "risk_score": float(probability), "history": history}
+
+        with self._lock:
+            for node_id, result in results.items():
+                result["prediction"] = 1 if result["risk_score"] > 0.5 else 0
+                result["band"] = risk_band(result["risk_score"])
+                if self._bands.get(node_id) != result["band"]:
+                    self._bands[node_id] = result["band"]
+                    self._unsent[node_id] = result
+            changes = dict(self._unsent)
+        return results, changes
+
+    def mark_sent(self, changes):
+        """Forgets band changes the server has accepted (newer ones for the same node are kept)."""
+        with self._lock:
+            for node_id, result in changes.items():
+                if self._unsent.get(node_id) is result:
+                    del self._unsent[node_id]
+
+    def summary(self, results):
+        """Aggregates one flush for the upstream server."""
+        bands = defaultdict(int)
+        for band in self._bands.values():
+            bands[band] += 1
+        return {
+            "timestamp": time.time(),
+            "nodes_scored": len(results),
+            "nodes_tracked": len(self._bands),
+            "max_risk": max((r["risk_score"] for r in results.values()), default=None),
+            "bands": dict(bands),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the forest for edge scoring and check it.")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--out", default=COMPACT_MODEL_PATH)
+    args = parser.parse_args()
+
+    import joblib
+    import pandas as pd
+
+    path = export_compact_model(args.model, args.out)
+    print(f"Compact model written to {path} ({os.path.getsize(path) / 1024:.0f} KB, "
+          f"original {os.path.getsize(args.model) / 1024:.0f} KB)")
+
+    # Check the export against the original forest on random feature rows
+    model_data = joblib.load(args.model)
+    forest = CompactForest(path)
+    rng = np.random.default_rng(42)
+    rain = rng.gamma(shape=0.6, scale=12.0, size=(2000, 7))
+    days = rng.integers(1, 366, size=2000)
+    X = pd.DataFrame({f"lag_{i}": rain[:, -1 - i] for i in range(1, 7)})
+    X["sum_3d"] = rain[:, -3:].sum(axis=1)
+    X["sum_6d"] = rain[:, -6:].sum(axis=1)
+    X["dayofyear"] = days
+    X["month"] = np.minimum(days // 31 + 1, 12)
+    X = X[model_data["features"]]
+
+    expected = model_data["model"].predict_proba(X)[:, 1]
+    actual = forest.predict_proba(X.to_numpy())
+    print(f"Max abs difference vs scikit-learn: {np.abs(expected - actual).max():.2e}")
@@ -0,0 +1,206 @@
+# ingest.py
+# Streaming ingest stage for sensor readings: schema checks, monotonic
+# timestamp de-duplication, rolling-median spike filtering and TTL-based
+# eviction of nodes that have gone silent.
+
+import math
+import statistics
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime
+
+# --- Configuration ---
+# Valid ranges (readings outside these are rejected, not clipped)
+MAX_RAINFALL_MM_HR = 500.0
+MAX_WATER_LEVEL_CM = 1000.0
+NUMERIC_FIELDS = {
+    "rainfall_mm_hr": (0.0, MAX_RAINFALL_MM_HR),
+    "water_level_cm": (0.0, MAX_WATER_LEVEL_CM),
+    "flow_rate_lps": (0.0, None),
+    "lat": (-90.0, 90.0),
+    "lon": (-180.0, 180.0),
+}
+REQUIRED_FIELDS = ["node_id", "rainfall_mm_hr"]
+
+# Hampel-style spike check on rainfall: a reading further than SPIKE_MADS
+# scaled median absolute deviations from the rolling median of the previous
+# readings (and more than SPIKE_MIN_MM away) is flagged as a suspected spike.
+# It is kept as-is for scoring; only if the next reading falls back to the
+# median is it treated as an isolated outlier and corrected.
+SPIKE_WINDOW = 5
+SPIKE_MADS = 3.0
+SPIKE_MIN_MM = 20.0
+
+# A reading without a timestamp that is identical to the node's previous
+# one within this window is treated as a retry (e.g. MQTT redelivery)
+DUPLICATE_WINDOW_SECONDS = 30
+
+# Nodes not heard from for this long are evicted and no longer scored
+STALE_TTL_SECONDS = 3 * 60 * 60
+
+
+class IngestError(ValueError):
+    """Raised when a reading fails validation."""
+
+
+def _to_number(field, value, low, high):
+    if isinstance(value, bool) or value is None:
+        raise IngestError(f"'{field}' must be a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"'{field}' must be a number, got {value!r}")
+    if not math.isfinite(number):
+        raise IngestError(f"'{field}' must be finite")
+    if (low is not None and number < low) or (high is not None and number > high):
+        raise IngestError(f"'{field}'={number} is out of range")
+    return number
+
+
+def _parse_timestamp(value):
+    """Accepts epoch seconds or an ISO-8601 string; returns epoch seconds."""
+    if isinstance(value, bool):
+        raise IngestError("'timestamp' must be epoch seconds or ISO-8601")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    raise IngestError("'timestamp' must be epoch seconds or ISO-8601")
+
+
+def _spike_median(value, previous):
+    """Returns the rolling median if `value` is an outlier against `previous`, else None."""
+    if len(previous) < 3:
+        return None
+    median = statistics.median(previous)
+    mad = statistics.median(abs(x - median) for x in previous) * 1.4826
+    if abs(value - median) > max(SPIKE_MADS * mad, SPIKE_MIN_MM):
+        return median
+    return None
+
+
+def validate(raw):
+    """Checks a raw reading and returns a cleaned copy with numeric fields as floats."""
+    if not isinstance(raw, dict):
+        raise IngestError("Reading must be a JSON object")
+    for field in REQUIRED_FIELDS:
+        if field not in raw:
+            raise IngestError(f"'{field}' is required")
+
+    node_id = raw["node_id"]
+    if not isinstance(node_id, str) or not node_id.strip():
+        raise IngestError("'node_id' must be a non-empty string")
+
+    record = dict(raw)
+    record["node_id"] = node_id.strip()
+    for field, (low, high) in NUMERIC_FIELDS.items():
+        if field not in raw:
+            continue
+        if raw[field] is None and field not in REQUIRED_FIELDS:
+            # An optional field sent as null is treated as not sent
+            del record[field]
+            continue
+        record[field] = _to_number(field, raw[field], low, high)
+    if raw.get("timestamp") is not None:
+        record["timestamp"] = _parse_timestamp(raw["timestamp"])
+    else:
+        record.pop("timestamp", None)
+    return record
+
+
+class SensorIngest:
+    """
+    Stateful ingest stage in front of the scoring store.
+
+    `accept()` returns the cleaned reading, None for a duplicate or
+    out-of-order reading (e.g. an MQTT retry), and raises IngestError for a
+    malformed one. A suspected spike is flagged with `spike_suspect` and its
+    rolling median; if the following reading falls back, that reading carries
+    `replaces_previous` with the value the stored spike should be replaced
+    by. `evict_stale()` returns the nodes whose TTL has expired.
+    """
+
+    def __init__(self, ttl_seconds=STALE_TTL_SECONDS, spike_window=SPIKE_WINDOW):
+        self.ttl_seconds = ttl_seconds
+        self._last_timestamp = {}
+        self._last_payload = {}  # node_id -> (raw reading, receive time) for readings without a timestamp
+        self._raw_rain = defaultdict(lambda: deque(maxlen=spike_window))
+        self._suspect = {}  # node_id -> rolling median when its last reading looked like a spike
+        # Ordered by last receive time, oldest first, so eviction stops at the first fresh node
+        self._last_seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"accepted": 0, "rejected": 0, "duplicates": 0, "filtered": 0, "evicted": 0}
+
+    def accept(self, raw, now=None):
+        now = time.time() if now is None else now
+        try:
+            record = validate(raw)
+        except IngestError:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise
+
+        node_id = record["node_id"]
+        with self._lock:
+            timestamp = record.get("timestamp")
+            if timestamp is not None:
+                last = self._last_timestamp.get(node_id)
+                if last is not None and timestamp <= last:
+                    self.stats["duplicates"] += 1
+                    return None
+                self._last_timestamp[node_id] = timestamp
+            else:
+                previous = self._last_payload.get(node_id)
+                if previous is not None and previous[0] == raw and now - previous[1] < DUPLICATE_WINDOW_SECONDS:
+                    self.stats["duplicates"] += 1
+                    return None
+                self._last_payload[node_id] = (dict(raw), now)
+
+            rain = record["rainfall_mm_hr"]
+            window = self._raw_rain[node_id]
+            suspect_median = self._suspect.pop(node_id, None)
+            if suspect_median is not None:
+                before_spike = list(window)[:-1]
+                if _spike_median(rain, before_spike) is None:
+                    # Fell back: the previous reading was an isolated spike
+                    window[-1] = suspect_median
+                    record["replaces_previous"] = suspect_median
+                    self.stats["filtered"] += 1
+                # Otherwise the jump was confirmed (e.g. a storm starting), so keep it
+            else:
+                median = _spike_median(rain, list(window))
+                if median is not None:
+                    record["spike_suspect"] = True
+                    record["rolling_median"] = median
+                    self._suspect[node_id] = median
+            window.append(rain)
+
+            self._last_seen[node_id] = now
+            self._last_seen.move_to_end(node_id)
+            self.stats["accepted"] += 1
+        return record
+
+    def evict_stale(self, now=None):
+        """Forgets nodes not heard from within the TTL and returns their ids."""
+        now = time.time() if now is None else now
+        evicted = []
+        with self._lock:
+            while self._last_seen:
+                node_id, seen = next(iter(self._last_seen.items()))
+                if now - seen < self.ttl_seconds:
+                    break
+                self._last_seen.popitem(last=False)
+                self._last_timestamp.pop(node_id, None)
+                self._last_payload.pop(node_id, None)
+                self._raw_rain.pop(node_id, None)
+                self._suspect.pop(node_id, None)
+                evicted.append(node_id)
+            self.stats["evicted"] += len(evicted)
+        return evicted
+
+    def last_seen(self, node_id):
+        return self._last_seen.get(node_id)
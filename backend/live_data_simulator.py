@@ -36,7 +36,8 @@ def get_live_weather(city, api_key):
             "lon": weather['coord']['lon'],
             "rainfall_mm_hr": rainfall_mm,
             "temperature_c": weather['main']['temp'],
-            "humidity_percent": weather['main']['humidity']
+            "humidity_percent": weather['main']['humidity'],
+            "timestamp": time.time()
         }
     except requests.exceptions.RequestException as e:
         print(f"Error fetching live weather: {e}")
@@ -56,7 +57,8 @@ def simulate_node_data(node_info):
         "lon": node_info['lon'],
         "rainfall_mm_hr": simulated_rainfall, # This is the crucial field for the model
         "water_level_cm": round(simulated_rainfall * random.uniform(0.5, 1.5), 2),
-        "flow_rate_lps": round(simulated_rainfall * random.uniform(2, 5), 2)
+        "flow_rate_lps": round(simulated_rainfall * random.uniform(2, 5), 2),
+        "timestamp": time.time()
     }
 
 def send_to_server(data):
@@ -82,7 +84,8 @@ if __name__ == "__main__":
                 "lat": 13.0827, "lon": 80.2707,
                 "rainfall_mm_hr": demo_rain_value,
                 "temperature_c": 29.5,
-                "humidity_percent": 85
+                "humidity_percent": 85,
+                "timestamp": time.time()
             }
         else:
             print("LIVE MODE: Fetching real weather from OpenWeatherMap...")
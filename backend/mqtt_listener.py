@@ -2,6 +2,8 @@
 import paho.mqtt.client as mqtt
 import requests
 import json
+import os
+import time
 
 # --- Configuration ---
 MQTT_BROKER = "broker.hivemq.com"
@@ -10,6 +12,22 @@ MQTT_PORT = 1883
 MQTT_TOPIC = "ishani-jindal/flood-sensor/drain01" 
 SERVER_URL = "https://floodprediction-dashboard.onrender.com/data"
 
+# --- Edge Scoring (set EDGE_SCORING=1 to score on the gateway) ---
+# Readings are scored here in batches; risk is published back to MQTT for
+# nearby actuators and pumps, and only band changes plus a periodic summary
+# are sent to the server.
+EDGE_SCORING = os.environ.get("EDGE_SCORING", "0") == "1"
+GATEWAY_ID = os.environ.get("GATEWAY_ID", "gateway_01")
+RISK_TOPIC = f"{MQTT_TOPIC}/risk"
+EDGE_SERVER_URL = "https://floodprediction-dashboard.onrender.com/edge"
+FLUSH_INTERVAL_SECONDS = 2.0
+SUMMARY_INTERVAL_SECONDS = 60.0
+
+scorer = None
+if EDGE_SCORING:
+    from edge_scorer import CompactForest, EdgeScorer
+    scorer = EdgeScorer(CompactForest())
+
 def on_connect(client, userdata, flags, rc):
     """Callback for when the client connects to the broker."""
     if rc == 0:
@@ -24,17 +42,65 @@ def on_message(client, userdata, msg):
     try:
         payload_str = msg.payload.decode()
         print(f"\nReceived message: {payload_str}")
-        
+
         data = json.loads(payload_str)
-        
+
+        if scorer is not None:
+            # Scored locally on the next flush
+            scorer.add(data)
+            return
+
         # Forward the data to the local Flask server
         response = requests.post(SERVER_URL, json=data)
         response.raise_for_status()
         print(f"  --> Relayed to server. Status: {response.status_code}")
-        
+
     except Exception as e:
         print(f"[ERROR] Could not process or relay message: {e}")
 
+def publish_risk(client, results):
+    """Publishes each node's latest risk (retained) for local actuators."""
+    for node_id, result in results.items():
+        message = {
+            "node_id": node_id,
+            "risk_score": result["risk_score"],
+            "band": result["band"],
+            "prediction": result["prediction"],
+            "timestamp": time.time(),
+        }
+        client.publish(f"{RISK_TOPIC}/{node_id}", json.dumps(message), qos=1, retain=True)
+
+def forward_upstream(summary, changes):
+    """Sends band changes and the aggregate summary to the central server; returns True on success."""
+    try:
+        response = requests.post(EDGE_SERVER_URL, json={
+            "gateway_id": GATEWAY_ID,
+            "summary": summary,
+            "changes": changes,
+        }, timeout=5)
+        response.raise_for_status()
+        print(f"  --> Sent {len(changes)} band change(s) upstream. Status: {response.status_code}")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"[ERROR] Could not forward edge summary: {e}")
+        return False
+
+def run_edge_loop(client):
+    """Flushes the scorer on a fixed interval while the MQTT loop runs in the background."""
+    client.loop_start()
+    last_summary = 0.0
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        results, changes = scorer.flush()
+        if results:
+            publish_risk(client, results)
+        now = time.time()
+        if changes or now - last_summary >= SUMMARY_INTERVAL_SECONDS:
+            # Unsent changes stay with the scorer and are sent again on the next flush
+            if forward_upstream(scorer.summary(results), changes):
+                scorer.mark_sent(changes)
+            last_summary = now
+
 # --- Main script ---
 client = mqtt.Client()
 client.on_connect = on_connect
@@ -43,5 +109,9 @@ client.on_message = on_message
 print(f"Attempting to connect to MQTT broker at {MQTT_BROKER}...")
 client.connect(MQTT_BROKER, MQTT_PORT, 60)
 
-# Start a forever loop to listen for messages
-client.loop_forever()
\ No newline at end of file
+if scorer is not None:
+    print(f"EDGE MODE: scoring locally as {GATEWAY_ID}, publishing risk to {RISK_TOPIC}/<node_id>")
+    run_edge_loop(client)
+else:
+    # Start a forever loop to listen for messages
+    client.loop_forever()
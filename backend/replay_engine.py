@@ -0,0 +1,222 @@
+# replay_engine.py
+# Backtests the flood model against historical rainfall series (IMD NetCDF
+# years or recorded sensor logs). Features are built for the whole series in
+# one vectorized pass and scored in a single predict_proba batch; several
+# storms or alert thresholds can be fanned out across a process pool.
+
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "rf_flood_model.joblib")
+
+# Must match train_from_imd_nc.py
+LAT_MIN, LAT_MAX = 12.75, 13.25
+LON_MIN, LON_MAX = 79.8, 80.5
+LABEL_WINDOW_DAYS = 3
+LABEL_THRESHOLD_MM = 50.0
+N_LAGS = 6
+
+DEFAULT_THRESHOLDS = [0.4, 0.6, 0.8]  # controlmodule risk bands
+MAX_LEAD_DAYS = 3  # an alert this many days before an event still counts as a detection
+
+
+# --- Loading Rainfall Series ---
+def load_imd_series(paths):
+    """Loads IMD NetCDF files and returns the Chennai-mean daily rainfall series."""
+    import xarray as xr  # only needed for NetCDF replays
+
+    datasets = [xr.open_dataset(p) for p in paths]
+    combined = xr.concat(datasets, dim="TIME") if len(datasets) > 1 else datasets[0]
+    combined = combined.rename({
+        old: new for old, new in [("LATITUDE", "lat"), ("LONGITUDE", "lon"), ("TIME", "time")]
+        if old in combined.coords
+    })
+    rain_var = "RAINFALL" if "RAINFALL" in combined.data_vars else list(combined.data_vars)[0]
+
+    sub = combined[rain_var].sel(lat=slice(LAT_MIN, LAT_MAX), lon=slice(LON_MIN, LON_MAX))
+    series = sub.mean(dim=["lat", "lon"]).to_series()
+    return series.resample("D").mean().interpolate().rename("rain_mm")
+
+
+def load_sensor_log(path):
+    """
+    Loads a recorded sensor log (CSV with `time` and `rainfall_mm_hr` columns)
+    and converts it to daily rainfall totals in mm.
+    """
+    log = pd.read_csv(path, parse_dates=["time"]).set_index("time").sort_index()
+    daily = log["rainfall_mm_hr"].astype(float).resample("D").mean() * 24.0
+    return daily.fillna(0.0).rename("rain_mm")
+
+
+# --- Vectorized Features and Labels ---
+def build_features(rain):
+    """Builds the model features for every day of a daily rainfall series at once."""
+    rain = rain.astype(float)
+    features = pd.DataFrame(index=rain.index)
+    for lag in range(1, N_LAGS + 1):
+        features[f"lag_{lag}"] = rain.shift(lag).fillna(0.0)
+    features["sum_3d"] = rain.rolling(window=3, min_periods=1).sum()
+    features["sum_6d"] = rain.rolling(window=6, min_periods=1).sum()
+    features["dayofyear"] = rain.index.dayofyear
+    features["month"] = rain.index.month
+    return features
+
+
+def label_events(rain):
+    """Marks the first day of each flood event, using the same rule as training."""
+    raw = rain.rolling(window=LABEL_WINDOW_DAYS, min_periods=1).sum() >= LABEL_THRESHOLD_MM
+    onset = raw & ~raw.shift(1, fill_value=False)
+    return onset.astype(int)
+
+
+def score_series(model, model_features, rain):
+    """Scores a full rainfall series in one batch and returns a per-day frame."""
+    features = build_features(rain)
+    probabilities = model.predict_proba(features[model_features])[:, 1]
+    return pd.DataFrame({
+        "rain_mm": rain.astype(float),
+        "risk_score": probabilities,
+        "event": label_events(rain),
+    }, index=rain.index)
+
+
+# --- Metrics ---
+def evaluate(scored, threshold, max_lead_days=MAX_LEAD_DAYS):
+    """
+    Computes detection lead times and false alarms at one alert threshold.
+
+    An event is detected if an alert is raised on the event day or up to
+    `max_lead_days` before it; the lead time is measured from the earliest such
+    alert. An alert onset with no event in the following `max_lead_days` days
+    is a false alarm.
+    """
+    alert = (scored["risk_score"].to_numpy() >= threshold)
+    event = scored["event"].to_numpy().astype(bool)
+    n = len(alert)
+
+    event_days = np.flatnonzero(event)
+    alert_onsets = np.flatnonzero(alert & ~np.concatenate(([False], alert[:-1])))
+
+    lead_times = []
+    missed = 0
+    for day in event_days:
+        window = alert[max(0, day - max_lead_days):day + 1]
+        hits = np.flatnonzero(window)
+        if hits.size:
+            lead_times.append(int(window.size - 1 - hits[0]))
+        else:
+            missed += 1
+
+    false_alarms = 0
+    for day in alert_onsets:
+        if not event[day:min(n, day + max_lead_days + 1)].any():
+            false_alarms += 1
+
+    n_events = len(event_days)
+    n_alerts = len(alert_onsets)
+    return {
+        "threshold": threshold,
+        "days": n,
+        "events": n_events,
+        "detected": n_events - missed,
+        "missed": missed,
+        "detection_rate": (n_events - missed) / n_events if n_events else None,
+        "mean_lead_days": float(np.mean(lead_times)) if lead_times else None,
+        "alerts": n_alerts,
+        "false_alarms": false_alarms,
+        "false_alarm_rate": false_alarms / n_alerts if n_alerts else None,
+    }
+
+
+# --- Parallel Replays ---
+_worker_model = None
+_worker_features = None
+
+
+def _init_worker(model_path):
+    """Loads the model once per worker process."""
+    global _worker_model, _worker_features
+    model_data = joblib.load(model_path)
+    _worker_model = model_data["model"]
+    _worker_features = model_data["features"]
+
+
+def _replay_job(job):
+    name, rain, thresholds = job
+    scored = score_series(_worker_model, _worker_features, rain)
+    return {
+        "storm": name,
+        "start": str(rain.index[0].date()),
+        "end": str(rain.index[-1].date()),
+        "results": [evaluate(scored, t) for t in thresholds],
+    }
+
+
+def run_replays(storms, thresholds=DEFAULT_THRESHOLDS, workers=None, model_path=MODEL_PATH):
+    """
+    Replays each named rainfall series and evaluates every threshold.
+
+    `storms` maps a name to a daily rainfall Series. Each series is one job in
+    the process pool, scored once and evaluated for all thresholds.
+    """
+    jobs = [(name, rain, list(thresholds)) for name, rain in storms.items()]
+    if workers == 1:
+        _init_worker(model_path)
+        return [_replay_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+        return list(pool.map(_replay_job, jobs))
+
+
+def split_by_year(rain):
+    """Splits a long series into one replay per calendar year."""
+    return {str(year): part for year, part in rain.groupby(rain.index.year) if len(part)}
+
+
+def print_report(reports):
+    print(f"{'storm':<16} | {'thr':>4} | {'events':>6} | {'detect':>6} | {'lead d':>6} | {'alerts':>6} | {'FAR':>5}")
+    print("-" * 70)
+    for report in reports:
+        for r in report["results"]:
+            detection = f"{r['detection_rate']:.2f}" if r["detection_rate"] is not None else "-"
+            lead = f"{r['mean_lead_days']:.2f}" if r["mean_lead_days"] is not None else "-"
+            far = f"{r['false_alarm_rate']:.2f}" if r["false_alarm_rate"] is not None else "-"
+            print(f"{report['storm']:<16} | {r['threshold']:>4.2f} | {r['events']:>6} | {detection:>6} | "
+                  f"{lead:>6} | {r['alerts']:>6} | {far:>5}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest the flood model on historical rainfall.")
+    parser.add_argument("--nc", help="Glob of IMD NetCDF files, replayed one year per job")
+    parser.add_argument("--log", action="append", default=[], help="Sensor log CSV (repeatable)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", help="Write the full report to this file")
+    args = parser.parse_args()
+
+    storms = {}
+    if args.nc:
+        nc_paths = sorted(glob.glob(args.nc))
+        if not nc_paths:
+            raise FileNotFoundError(f"No files found with pattern {args.nc}")
+        storms.update(split_by_year(load_imd_series(nc_paths)))
+    for path in args.log:
+        storms[os.path.basename(path)] = load_sensor_log(path)
+    if not storms:
+        parser.error("Provide --nc and/or --log")
+
+    reports = run_replays(storms, args.thresholds, args.workers)
+    print_report(reports)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Report saved to {args.json}")
@@ -0,0 +1,50 @@
+# risk_scoring.py
+# Scoring helpers shared by the central server and the edge gateway.
+
+from datetime import datetime
+
+# Nodes scored with simple thresholds instead of the model (the Wokwi sensor)
+THRESHOLD_NODES = {"drain_a01"}
+
+
+def uses_threshold_logic(node_id):
+    """Case-insensitive check for nodes that use threshold scoring."""
+    return node_id.lower() in THRESHOLD_NODES
+
+
+def calculate_threshold_risk(water_level, rainfall):
+    """
+    Calculates a risk score between 0.0 and 1.0 based on simple thresholds.
+    These thresholds can be easily adjusted.
+    """
+    # Define thresholds (Water level is out of 100cm, Rainfall in mm/hr)
+    CRITICAL_WATER = 90.0  # 90% full
+    HIGH_WATER = 75.0      # 75% full
+    MEDIUM_WATER = 50.0    # 50% full
+
+    CRITICAL_RAIN = 50.0   # Torrential downpour / cloudburst
+    HIGH_RAIN = 25.0       # Very heavy rain
+    MEDIUM_RAIN = 10.0     # Heavy rain
+
+    # Calculate risk score based on the most severe condition
+    if water_level >= CRITICAL_WATER or rainfall >= CRITICAL_RAIN:
+        return 0.95  # Critical risk
+    elif water_level >= HIGH_WATER or rainfall >= HIGH_RAIN:
+        return 0.75  # High risk
+    elif water_level >= MEDIUM_WATER or rainfall >= MEDIUM_RAIN:
+        return 0.45  # Medium risk
+    else:
+        return 0.10  # Low risk
+
+
+def history_features(history, now=None):
+    """Builds the model features from a node's last 7 rainfall readings (oldest first)."""
+    now = datetime.now() if now is None else now
+    return {
+        'lag_1': history[-2], 'lag_2': history[-3], 'lag_3': history[-4],
+        'lag_4': history[-5], 'lag_5': history[-6], 'lag_6': history[-7],
+        'sum_3d': sum(history[-3:]),
+        'sum_6d': sum(history[-6:]),
+        'dayofyear': now.timetuple().tm_yday,
+        'month': now.month
+    }
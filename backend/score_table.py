@@ -0,0 +1,271 @@
+# score_table.py
+# Optional constant-time scoring. The feature space is quantized into
+# (lag_1 x sum_3d x sum_6d x month) cells, the forest is evaluated offline
+# over sample histories falling in each cell, and the cell averages are
+# calibrated with isotonic regression. Serving is then one array lookup per
+# node instead of 200 tree traversals. Cells no sample reached are NaN and
+# the caller falls back to the forest, passed through the same isotonic
+# calibration (its breakpoints are saved with the table) so every score is on
+# one probability scale.
+#
+# The table is not a drop-in replacement for the forest: calibration and
+# binning move some scores across the 0.4/0.6/0.8 band cutoffs. On held-out
+# synthetic histories about 6% of rows land in a different risk band than
+# with the forest (93.7% agreement), so enabling USE_SCORE_TABLE=1 changes
+# which alerts fire. Check `band_agreement_vs_forest` in the report after
+# rebuilding.
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from controlmodule import risk_band
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "rf_flood_model.joblib")
+SCORE_TABLE_PATH = os.path.join(BASE_DIR, "rf_flood_score_table.npz")
+
+# Bin edges in mm; the last bin is open-ended
+LAG_1_EDGES = np.array([0, 0.5, 2.5, 5, 10, 15, 20, 25, 30, 40, 50, 65, 80, 100, 150], dtype=np.float32)
+SUM_3D_EDGES = np.array([0, 1, 5, 10, 20, 30, 40, 45, 50, 55, 60, 75, 100, 150, 200], dtype=np.float32)
+SUM_6D_EDGES = np.array([0, 2, 10, 20, 35, 50, 65, 80, 100, 125, 150, 200, 250, 300], dtype=np.float32)
+N_MONTHS = 12
+
+# Must match train_from_imd_nc.py
+LABEL_THRESHOLD_MM = 50.0
+
+N_TRAIN_SAMPLES = 400_000
+N_TEST_SAMPLES = 100_000
+RANDOM_SEED = 42
+
+
+# --- Quantization ---
+def _bin(values, edges):
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 1)
+
+
+def cell_index(frame):
+    """Returns the flat table index for each row of a feature frame."""
+    i = _bin(frame["lag_1"].to_numpy(), LAG_1_EDGES)
+    j = _bin(frame["sum_3d"].to_numpy(), SUM_3D_EDGES)
+    k = _bin(frame["sum_6d"].to_numpy(), SUM_6D_EDGES)
+    m = np.clip(frame["month"].to_numpy().astype(int) - 1, 0, N_MONTHS - 1)
+    return np.ravel_multi_index((i, j, k, m), (len(LAG_1_EDGES), len(SUM_3D_EDGES), len(SUM_6D_EDGES), N_MONTHS))
+
+
+def flood_labels(frame):
+    """First day of a flood event, as labelled in training (3-day sum crosses the threshold)."""
+    today = frame["sum_3d"] >= LABEL_THRESHOLD_MM
+    yesterday = (frame["lag_1"] + frame["lag_2"] + frame["lag_3"]) >= LABEL_THRESHOLD_MM
+    return (today & ~yesterday).astype(int).to_numpy()
+
+
+# --- Sample Histories ---
+def features_from_rain(rain, dates):
+    """Builds model features from (n x 7) daily rainfall windows (oldest first) ending on `dates`."""
+    frame = pd.DataFrame({f"lag_{i}": rain[:, -1 - i] for i in range(1, 7)})
+    frame["sum_3d"] = rain[:, -3:].sum(axis=1)
+    frame["sum_6d"] = rain[:, -6:].sum(axis=1)
+    frame["dayofyear"] = dates.dayofyear.to_numpy()
+    frame["month"] = dates.month.to_numpy()
+    return frame
+
+
+def synthetic_samples(n, rng):
+    """
+    Random 7-day rainfall windows spread over the whole feature range: each
+    window gets its own wet-day probability and storm intensity.
+    """
+    wet_prob = rng.uniform(0.1, 0.95, size=(n, 1))
+    intensity = rng.uniform(1.0, 45.0, size=(n, 1))
+    rain = rng.gamma(shape=0.8, size=(n, 7)) * intensity
+    rain = np.where(rng.random((n, 7)) < wet_prob, rain, 0.0).astype(np.float32)
+    dates = pd.to_datetime("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, size=n), unit="D")
+    return features_from_rain(rain, pd.DatetimeIndex(dates))
+
+
+def historical_samples(rain_series):
+    """Every 7-day window of a daily rainfall series (e.g. from replay_engine.load_imd_series)."""
+    values = rain_series.to_numpy(dtype=np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(values, 7)
+    return features_from_rain(windows, rain_series.index[6:])
+
+
+# --- Building the Table ---
+def build_table(model, model_features, samples):
+    """
+    Evaluates the forest on the samples, averages it per cell and fits an
+    isotonic calibration of the cell averages against the flood labels.
+    """
+    from sklearn.isotonic import IsotonicRegression
+
+    raw = model.predict_proba(samples[model_features])[:, 1]
+    cells = cell_index(samples)
+    n_cells = len(LAG_1_EDGES) * len(SUM_3D_EDGES) * len(SUM_6D_EDGES) * N_MONTHS
+
+    counts = np.bincount(cells, minlength=n_cells)
+    sums = np.bincount(cells, weights=raw, minlength=n_cells)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        raw_table = np.where(counts > 0, sums / counts, np.nan)
+
+    calibrator = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip")
+    calibrator.fit(raw_table[cells], flood_labels(samples))
+
+    table = np.full(n_cells, np.nan, dtype=np.float32)
+    filled = counts > 0
+    table[filled] = calibrator.predict(raw_table[filled])
+    return table, calibrator
+
+
+def save_table(table, calibrator, path=SCORE_TABLE_PATH):
+    np.savez_compressed(
+        path,
+        table=table,
+        calibration_x=calibrator.X_thresholds_.astype(np.float32),
+        calibration_y=calibrator.y_thresholds_.astype(np.float32),
+        lag_1_edges=LAG_1_EDGES,
+        sum_3d_edges=SUM_3D_EDGES,
+        sum_6d_edges=SUM_6D_EDGES,
+    )
+    return path
+
+
+# --- Serving ---
+class ScoreTable:
+    """Calibrated flood probability by array lookup."""
+
+    def __init__(self, path=SCORE_TABLE_PATH):
+        with np.load(path) as data:
+            if not (np.array_equal(data["lag_1_edges"], LAG_1_EDGES)
+                    and np.array_equal(data["sum_3d_edges"], SUM_3D_EDGES)
+                    and np.array_equal(data["sum_6d_edges"], SUM_6D_EDGES)):
+                raise ValueError(f"{path} was built with different bin edges; rebuild it")
+            if "calibration_x" not in data:
+                raise ValueError(f"{path} has no calibration breakpoints; rebuild it")
+            self.table = data["table"]
+            self.calibration_x = data["calibration_x"]
+            self.calibration_y = data["calibration_y"]
+
+    def calibrate(self, probabilities):
+        """Maps raw forest probabilities onto the table's calibrated scale (for the fallback path)."""
+        # Isotonic regression is piecewise linear between its breakpoints and clipped outside them
+        return np.interp(probabilities, self.calibration_x, self.calibration_y)
+
+    def lookup(self, features):
+        """Returns the probability for one feature dict, or None if its cell is empty."""
+        i = _bin(features["lag_1"], LAG_1_EDGES)
+        j = _bin(features["sum_3d"], SUM_3D_EDGES)
+        k = _bin(features["sum_6d"], SUM_6D_EDGES)
+        m = min(max(int(features["month"]) - 1, 0), N_MONTHS - 1)
+        index = ((i * len(SUM_3D_EDGES) + j) * len(SUM_6D_EDGES) + k) * N_MONTHS + m
+        value = self.table[index]
+        return None if np.isnan(value) else float(value)
+
+    def predict_proba(self, frame):
+        """Vectorized lookup for a feature frame; empty cells come back as NaN."""
+        return self.table[cell_index(frame)]
+
+
+# --- Report ---
+def _auc(scores, labels):
+    from sklearn.metrics import roc_auc_score
+    return float(roc_auc_score(labels, scores)) if len(np.unique(labels)) > 1 else None
+
+
+def _time_per_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def evaluate(model, model_features, table, calibrator, test):
+    """Compares the table with the full forest on held-out samples."""
+    from sklearn.metrics import brier_score_loss
+
+    labels = flood_labels(test)
+    forest = model.predict_proba(test[model_features])[:, 1]
+    looked_up = ScoreTable.__new__(ScoreTable)
+    looked_up.table = table
+    table_scores = looked_up.predict_proba(test)
+    covered = ~np.isnan(table_scores)
+    # Uncovered rows fall back to the calibrated forest, as in serving
+    served = np.where(covered, table_scores, calibrator.predict(forest))
+
+    forest_bands = np.array([risk_band(p) for p in forest])
+    served_bands = np.array([risk_band(p) for p in served])
+
+    row = test.iloc[[0]][model_features]
+    features = test.iloc[0].to_dict()
+    forest_single = _time_per_call(lambda: model.predict_proba(row), 50)
+    table_single = _time_per_call(lambda: looked_up.lookup(features), 5000)
+    forest_batch = _time_per_call(lambda: model.predict_proba(test[model_features]), 1)
+    table_batch = _time_per_call(lambda: looked_up.predict_proba(test), 10)
+
+    return {
+        "test_samples": int(len(test)),
+        "flood_rate": float(labels.mean()),
+        "cell_coverage": float(covered.mean()),
+        "accuracy": {
+            "forest_auc": _auc(forest, labels),
+            "table_auc": _auc(served, labels),
+            "forest_brier": float(brier_score_loss(labels, forest)),
+            "forest_isotonic_brier": float(brier_score_loss(labels, calibrator.predict(forest))),
+            "table_brier": float(brier_score_loss(labels, served)),
+            "mean_abs_diff_vs_forest": float(np.abs(served - forest).mean()),
+            "band_agreement_vs_forest": float((forest_bands == served_bands).mean()),
+        },
+        "speed": {
+            "forest_single_row_us": forest_single * 1e6,
+            "table_single_row_us": table_single * 1e6,
+            "single_row_speedup": forest_single / table_single,
+            "forest_batch_us_per_row": forest_batch / len(test) * 1e6,
+            "table_batch_us_per_row": table_batch / len(test) * 1e6,
+            "batch_speedup": forest_batch / table_batch,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the calibrated scoring lookup table.")
+    parser.add_argument("--nc", help="Glob of IMD NetCDF files to sample histories from (default: synthetic)")
+    parser.add_argument("--samples", type=int, default=N_TRAIN_SAMPLES)
+    parser.add_argument("--out", default=SCORE_TABLE_PATH)
+    parser.add_argument("--json", help="Write the accuracy/speed report to this file")
+    args = parser.parse_args()
+
+    import joblib
+
+    model_data = joblib.load(MODEL_PATH)
+    model, model_features = model_data["model"], model_data["features"]
+    rng = np.random.default_rng(RANDOM_SEED)
+
+    if args.nc:
+        import glob
+        from replay_engine import load_imd_series
+
+        samples = historical_samples(load_imd_series(sorted(glob.glob(args.nc))))
+        shuffled = samples.sample(frac=1.0, random_state=RANDOM_SEED)
+        split = int(len(shuffled) * 0.8)
+        train, test = shuffled.iloc[:split], shuffled.iloc[split:]
+        # Real histories are sparse in the storm corner, so pad with synthetic windows
+        train = pd.concat([train, synthetic_samples(args.samples, rng)], ignore_index=True)
+    else:
+        train = synthetic_samples(args.samples, rng)
+        test = synthetic_samples(N_TEST_SAMPLES, rng)
+
+    table, calibrator = build_table(model, model_features, train)
+    path = save_table(table, calibrator, args.out)
+    print(f"Score table written to {path} ({os.path.getsize(path) / 1024:.0f} KB, "
+          f"{np.isfinite(table).mean() * 100:.1f}% of cells filled)")
+
+    report = evaluate(model, model_features, table, calibrator, test.reset_index(drop=True))
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -1,12 +1,22 @@
 # server.py - FINAL UPDATED CODE
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import joblib
 import os
+import threading
+import time
 import pandas as pd
+from datetime import date
 from collections import deque, defaultdict
 from controlmodule import generate_control_strategies
+from risk_scoring import calculate_threshold_risk, history_features, uses_threshold_logic
+from spatial_grid import RiskGrid
+from drainage_network import DrainageNetwork
+from alert_dispatcher import AlertPipeline
+from ingest import IngestError, SensorIngest, validate as validate_reading
+from api_encoding import EncodedSnapshotCache, negotiate_encoding
+from score_table import SCORE_TABLE_PATH, ScoreTable
 
 app = Flask(__name__)
 CORS(app)
@@ -24,112 +34,357 @@ except Exception as e:
     print(f"Error loading model: {e}")
     model = None
 
-# --- NEW FUNCTION FOR THRESHOLD-BASED RISK SCORING ---
-def calculate_threshold_risk(water_level, rainfall):
-    """
-    Calculates a risk score between 0.0 and 1.0 based on simple thresholds.
-    These thresholds can be easily adjusted.
-    """
-    # Define thresholds (Water level is out of 100cm, Rainfall in mm/hr)
-    CRITICAL_WATER = 90.0  # 90% full
-    HIGH_WATER = 75.0      # 75% full
-    MEDIUM_WATER = 50.0    # 50% full
-
-    CRITICAL_RAIN = 50.0   # Torrential downpour / cloudburst
-    HIGH_RAIN = 25.0       # Very heavy rain
-    MEDIUM_RAIN = 10.0     # Heavy rain
-
-    # Calculate risk score based on the most severe condition
-    if water_level >= CRITICAL_WATER or rainfall >= CRITICAL_RAIN:
-        return 0.95  # Critical risk
-    elif water_level >= HIGH_WATER or rainfall >= HIGH_RAIN:
-        return 0.75  # High risk
-    elif water_level >= MEDIUM_WATER or rainfall >= MEDIUM_RAIN:
-        return 0.45  # Medium risk
-    else:
-        return 0.10  # Low risk
+# --- Optional Score Table (set USE_SCORE_TABLE=1) ---
+# Calibrated lookup table built by score_table.py; nodes whose cell is empty fall back to the
+# forest on the same calibrated scale. This moves about 6% of nodes to a different risk band.
+score_table = None
+if os.environ.get("USE_SCORE_TABLE", "0") == "1":
+    try:
+        score_table = ScoreTable(SCORE_TABLE_PATH)
+        print("OK: Score table loaded.")
+    except Exception as e:
+        print(f"Error loading score table: {e}")
 
 # --- In-Memory Data Storage ---
 sensor_live_data = {}
 sensor_histories = defaultdict(lambda: deque([0.0] * 7, maxlen=7))
+sensor_ingest = SensorIngest()
+edge_results = {}      # node_id -> latest result forwarded by an edge gateway
+edge_gateways = {}     # gateway_id -> {"summary", "received_at"}
+node_versions = {}     # node_id -> data_version of its latest reading
+node_scores = {}       # node_id -> ((node version, date), result) from the last time it was scored
+risk_grid = RiskGrid()
+drainage_network = DrainageNetwork.from_resources()
+alert_pipeline = AlertPipeline()
+alert_pipeline.start()
+status_cache = EncodedSnapshotCache()
+# Bumped whenever stored readings change; cached responses are keyed on it
+data_version = 0
+grid_version = None
+scored_snapshot = {"version": None, "predictions": {}}
+# Guards the stored readings, edge results and data_version. Ingest, /edge,
+# eviction and the version bump write under it; scoring copies under it and
+# works on the copies.
+data_lock = threading.Lock()
+# Scoring updates the drainage graph and alert bands, so only one request scores at a time
+scoring_lock = threading.RLock()
+# Alerts must not wait for a client to poll /status, so new readings are also scored in the background
+BACKGROUND_SCORING = os.environ.get("BACKGROUND_SCORING", "1") == "1"
+BACKGROUND_SCORING_SECONDS = 5
 
 # --- API Endpoints ---
 @app.route('/data', methods=['POST'])
 def receive_data():
-    data = request.get_json()
-    node_id = data.get('node_id')
-    if not node_id:
-        return jsonify({"status": "error", "message": "node_id is required"}), 400
+    global data_version
+    payload = request.get_json(silent=True)
+    with data_lock:
+        try:
+            data = sensor_ingest.accept(payload)
+        except IngestError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        if data is None:
+            # Duplicate or out-of-order reading (e.g. an MQTT retry); acknowledge so it isn't resent
+            return jsonify({"status": "duplicate"}), 200
+
+        node_id = data['node_id']
+        sensor_live_data[node_id] = data
 
-    sensor_live_data[node_id] = data
-    
-    rainfall = data.get('rainfall_mm_hr', 0.0)
-    sensor_histories[node_id].append(rainfall)
+        rainfall = data['rainfall_mm_hr']
+        history = sensor_histories[node_id]
+        if 'replaces_previous' in data:
+            # The previous reading turned out to be an isolated spike
+            history[-1] = data['replaces_previous']
+        history.append(rainfall)
+        data_version += 1
+        node_versions[node_id] = data_version
+
+        water_level = data.get('water_level_cm')
+        if water_level is not None:
+            drainage_network.update(node_id, water_level=water_level)
 
     print(f"Received data from {node_id}. Current rainfall: {rainfall}")
     return jsonify({"status": "success"}), 200
 
 
-@app.route('/status', methods=['GET'])
-def get_status():
-    if not model:
-        return jsonify({"error": "Model not loaded"}), 500
+def _node_result(live_data, prediction, risk_score, history):
+    return {
+        "live_data": live_data,
+        "prediction": int(prediction),
+        "risk_score": float(risk_score),
+        "history": history
+    }
 
-    predictions = {}
-    
-    for node_id, history_deque in sensor_histories.items():
-        if node_id not in sensor_live_data:
-            continue
 
-        # --- START OF MODIFICATION ---
-         # We will make the comparison case-insensitive to be more robust
-        if node_id.lower() == "drain_a01":
-            
+def score_nodes(readings):
+    """
+    Scores {node_id: (live_data, history)}. Nodes on the model are scored in
+    one predict_proba batch, and their prediction is read off the probability.
+    """
+    results = {}
+    model_nodes = []
+    rows = []
+    for node_id, (live_data, history) in readings.items():
+        if uses_threshold_logic(node_id):
             # This message should appear for your Wokwi sensor
-            print(f"DEBUG: Node '{node_id}' is using THRESHOLD logic.") 
-            
-            live_data = sensor_live_data.get(node_id, {})
+            print(f"DEBUG: Node '{node_id}' is using THRESHOLD logic.")
+
             water_level = live_data.get("water_level_cm", 0.0)
             rainfall = live_data.get("rainfall_mm_hr", 0.0)
-            
             risk_score = calculate_threshold_risk(water_level, rainfall)
-            prediction = 1 if risk_score > 0.5 else 0 
-            
-            predictions[node_id] = {
+            results[node_id] = _node_result(live_data, risk_score > 0.5, risk_score, history)
+            continue
+
+        features = history_features(history)
+        probability = score_table.lookup(features) if score_table is not None else None
+        if probability is not None:
+            results[node_id] = _node_result(live_data, probability > 0.5, probability, history)
+        else:
+            model_nodes.append(node_id)
+            rows.append(features)
+
+    if rows:
+        print(f"DEBUG: Scoring {len(rows)} node(s) with MACHINE LEARNING logic.")
+        probabilities = model.predict_proba(pd.DataFrame(rows)[model_features])[:, 1]
+        if score_table is not None:
+            # Keep fallback scores on the table's calibrated scale
+            probabilities = score_table.calibrate(probabilities)
+        for node_id, probability in zip(model_nodes, probabilities):
+            live_data, history = readings[node_id]
+            # Same as model.predict for the two-class forest
+            results[node_id] = _node_result(live_data, probability > 0.5, probability, history)
+    return results
+
+
+def evict_stale_nodes():
+    """Drops nodes whose last reading is older than the ingest TTL."""
+    global data_version
+    with data_lock:
+        for node_id in sensor_ingest.evict_stale():
+            sensor_live_data.pop(node_id, None)
+            sensor_histories.pop(node_id, None)
+            node_versions.pop(node_id, None)
+            # A silent node should stop pushing water and risk downstream
+            drainage_network.update(node_id, water_level=0.0, risk=0.0)
+            data_version += 1
+            print(f"Evicted stale node {node_id}.")
+
+        # Edge nodes only report band changes, so they live as long as their gateway's heartbeat
+        now = time.time()
+        for gateway_id, gateway in list(edge_gateways.items()):
+            if now - gateway["received_at"] < sensor_ingest.ttl_seconds:
+                continue
+            del edge_gateways[gateway_id]
+            for node_id in [n for n, r in edge_results.items() if r["gateway_id"] == gateway_id]:
+                del edge_results[node_id]
+                drainage_network.update(node_id, water_level=0.0, risk=0.0)
+                data_version += 1
+            print(f"Evicted stale gateway {gateway_id}.")
+
+
+def score_all_nodes():
+    """
+    Scores every node that has a live reading. Only nodes with a new reading
+    (or all of them, once the date moves on) go through the model again.
+    """
+    today = date.today()
+    with data_lock:
+        keys = {node_id: (node_versions[node_id], today) for node_id in sensor_live_data}
+        changed = {
+            node_id: (sensor_live_data[node_id], list(sensor_histories[node_id]))
+            for node_id, key in keys.items()
+            if node_scores.get(node_id, (None,))[0] != key
+        }
+        edge_snapshot = list(edge_results.items())
+
+    for node_id, result in score_nodes(changed).items():
+        node_scores[node_id] = (keys[node_id], result)
+    for node_id in [n for n in node_scores if n not in keys]:
+        del node_scores[node_id]
+
+    predictions = {node_id: dict(node_scores[node_id][1]) for node_id in keys}
+    # Nodes already scored on a gateway are reported as-is
+    for node_id, result in edge_snapshot:
+        predictions.setdefault(node_id, dict(result))
+    return predictions
+
+
+def snapshot_version():
+    """Identifies the current state of the readings (the date is included for the day features)."""
+    evict_stale_nodes()
+    return f"{data_version}-{date.today().isoformat()}"
+
+
+def current_predictions(version):
+    """Scores all nodes once per snapshot version and reuses the result until it changes."""
+    with scoring_lock:
+        return _score_snapshot(version)
+
+
+def _score_snapshot(version):
+    if scored_snapshot["version"] == version:
+        return scored_snapshot["predictions"]
+
+    predictions = score_all_nodes()
+
+    # Feed fresh risk into the drainage graph, then report what reaches each node
+    for node_id, result in predictions.items():
+        drainage_network.update(node_id, risk=result["risk_score"])
+    for node_id, result in predictions.items():
+        result["network"] = drainage_network.state(node_id)
+
+    # Only band changes are queued; delivery happens on the alert workers
+    alert_pipeline.observe_many({
+        node_id: result["network"]["network_risk"] for node_id, result in predictions.items()
+    })
+
+    scored_snapshot["version"] = version
+    scored_snapshot["predictions"] = predictions
+    return predictions
+
+
+def background_scoring():
+    """
+    Re-scores every few seconds when readings change, so band changes raise
+    alerts without a client polling. Only nodes with new readings are re-run.
+    """
+    while True:
+        time.sleep(BACKGROUND_SCORING_SECONDS)
+        if not model:
+            continue
+        try:
+            current_predictions(snapshot_version())
+        except Exception as e:
+            print(f"Error in background scoring: {e}")
+
+
+if BACKGROUND_SCORING:
+    threading.Thread(target=background_scoring, name="background-scoring", daemon=True).start()
+
+
+@app.route('/status', methods=['GET'])
+def get_status():
+    if not model:
+        return jsonify({"error": "Model not loaded"}), 500
+
+    version = snapshot_version()
+    # Weak, because the same snapshot is served in several content encodings
+    etag = f"status-{version}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    # The encoded (and compressed) body is built once per version and served from cache
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    body, applied = status_cache.get("status", version, lambda: current_predictions(version), encoding)
+
+    response = Response(body, mimetype="application/json")
+    if applied:
+        response.headers["Content-Encoding"] = applied
+    response.headers["Vary"] = "Accept-Encoding"
+    response.set_etag(etag, weak=True)
+    return response
+
+
+@app.route('/edge', methods=['POST'])
+def receive_edge_summary():
+    """Accepts band changes and a summary from a gateway running in edge-scoring mode."""
+    global data_version
+    data = request.get_json(silent=True) or {}
+    gateway_id = data.get('gateway_id')
+    changes = data.get('changes', {})
+    if not gateway_id or not isinstance(changes, dict):
+        return jsonify({"status": "error", "message": "gateway_id and a changes object are required"}), 400
+
+    # Check every change before storing any of them
+    validated = {}
+    for node_id, result in changes.items():
+        if not isinstance(result, dict) or not isinstance(result.get("live_data"), dict):
+            return jsonify({"status": "error", "message": f"Change for {node_id} needs a live_data object"}), 400
+        try:
+            live_data = validate_reading(dict(result["live_data"], node_id=node_id))
+            risk_score = float(result["risk_score"])
+            history = result.get("history", [])
+            if not isinstance(history, list):
+                return jsonify({"status": "error", "message": f"history for {node_id} must be a list"}), 400
+            history = [float(v) for v in history]
+        except IngestError as e:
+            return jsonify({"status": "error", "message": f"Invalid live_data for {node_id}: {e}"}), 400
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"status": "error", "message": f"Invalid risk_score or history for {node_id}"}), 400
+        if not 0.0 <= risk_score <= 1.0:
+            return jsonify({"status": "error", "message": f"risk_score for {node_id} must be between 0 and 1"}), 400
+        validated[node_id] = (live_data, risk_score, history)
+
+    with data_lock:
+        for node_id, (live_data, risk_score, history) in validated.items():
+            edge_results[node_id] = {
                 "live_data": live_data,
-                "prediction": prediction,
+                "prediction": 1 if risk_score > 0.5 else 0,
                 "risk_score": risk_score,
-                "history": list(history_deque) 
+                "history": history,
+                "gateway_id": gateway_id,
             }
-        else:
-            
-            # If you see this message for DRAIN_A01, there is a problem
-            print(f"DEBUG: Node '{node_id}' is using MACHINE LEARNING logic.")
-            
-            history = list(history_deque)
-            
-            features = {
-                'lag_1': history[-2], 'lag_2': history[-3], 'lag_3': history[-4],
-                'lag_4': history[-5], 'lag_5': history[-6], 'lag_6': history[-7],
-                'sum_3d': sum(history[-3:]),
-                'sum_6d': sum(history[-6:]),
-                'dayofyear': pd.Timestamp.now().dayofyear,
-                'month': pd.Timestamp.now().month
-            }
-            input_df = pd.DataFrame([features])[model_features]
-            
-            prediction = model.predict(input_df)[0]
-            probability = model.predict_proba(input_df)[0][1]
-
-            predictions[node_id] = {
-                "live_data": sensor_live_data[node_id],
-                "prediction": int(prediction),
-                "risk_score": float(probability),
-                "history": history
-            }
-        # --- END OF DEBUG MODIFICATION ---
-            
-    return jsonify(predictions)
+            water_level = live_data.get("water_level_cm")
+            if water_level is not None:
+                drainage_network.update(node_id, water_level=water_level)
+            data_version += 1
+
+        edge_gateways[gateway_id] = {"summary": data.get("summary", {}), "received_at": time.time()}
+    return jsonify({"status": "success", "accepted": len(changes)}), 200
+
+
+# --- SPATIAL RISK GRID ---
+def refresh_risk_grid():
+    """Re-interpolates the grid if any reading arrived since the last refresh."""
+    global grid_version
+    version = snapshot_version()
+    if grid_version == version:
+        return
+    grid_version = version
+
+    readings = {}
+    for node_id, result in current_predictions(version).items():
+        live_data = result["live_data"]
+        readings[node_id] = {
+            "lat": live_data.get("lat"),
+            "lon": live_data.get("lon"),
+            "rainfall": live_data.get("rainfall_mm_hr", 0.0),
+            "risk": result["risk_score"],
+        }
+    risk_grid.update(readings)
+
+
+@app.route('/grid', methods=['GET'])
+def get_grid():
+    if not model:
+        return jsonify({"error": "Model not loaded"}), 500
+
+    refresh_risk_grid()
+    return jsonify(risk_grid.metadata())
+
+
+@app.route('/grid/<layer>/<int:tile_row>/<int:tile_col>.png', methods=['GET'])
+def get_grid_tile(layer, tile_row, tile_col):
+    if not model:
+        return jsonify({"error": "Model not loaded"}), 500
+
+    refresh_risk_grid()
+    png = risk_grid.tile(layer, tile_row, tile_col)
+    if png is None:
+        return jsonify({"error": "Tile not available"}), 404
+
+    etag = f"{layer}-{tile_row}-{tile_col}-{risk_grid.version}"
+    if request.if_none_match.contains(etag):
+        # The client's copy is still current, so only revalidate it
+        response = Response(status=304)
+    else:
+        response = Response(png, mimetype="image/png")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+# --- END SPATIAL RISK GRID ---
 
 # --- ADDED: NEW ENDPOINT FOR CONTROL STRATEGIES ---
 @app.route('/api/suggestions', methods=['POST'])
@@ -1,6 +1,7 @@
 import joblib
 import pandas as pd
 import numpy as np
+from replay_engine import build_features
 
 # --- 1. Load the Trained Model and Feature List ---
 MODEL_PATH = "rf_flood_model.joblib"
@@ -27,37 +28,17 @@ print(simulation_df['rain_mm'].to_string())
 print("-" * 60)
 
 
-# --- 3. Run the Daily Prediction Loop ---
+# --- 3. Run the Daily Predictions ---
+# All days are featurised in one vectorized pass and scored in a single batch
 print("--- Running Daily Flood Predictions ---")
-for date in simulation_df.index:
-    # Get the history of rainfall up to (and including) the current day
-    history = simulation_df.loc[:date]
-
-    # --- Feature Engineering for the current day ---
-    # Calculate lag features (rainfall on previous days) based on history
-    current_day_features = {}
-    for i in range(1, 7):
-        if len(history) > i:
-            current_day_features[f'lag_{i}'] = history['rain_mm'].shift(i).iloc[-1]
-        else:
-            current_day_features[f'lag_{i}'] = 0
-            
-    # Calculate sum features (rolling sums)
-    current_day_features['sum_3d'] = history['rain_mm'].rolling(window=3, min_periods=1).sum().iloc[-1]
-    current_day_features['sum_6d'] = history['rain_mm'].rolling(window=6, min_periods=1).sum().iloc[-1]
-    
-    # Add time features
-    current_day_features['dayofyear'] = date.dayofyear
-    current_day_features['month'] = date.month
-
-    # --- Make Prediction ---
-    input_df = pd.DataFrame([current_day_features])[model_features]
-    prediction = model.predict(input_df)[0]
-    probability = model.predict_proba(input_df)[0][1]
+features = build_features(simulation_df['rain_mm'])[model_features]
+predictions = model.predict(features)
+probabilities = model.predict_proba(features)[:, 1]
 
+for date, rain_today, prediction, probability in zip(
+        simulation_df.index, simulation_df['rain_mm'], predictions, probabilities):
     # --- Print Daily Report ---
     result_text = "🚨 FLOOD" if prediction == 1 else "✅ No Flood"
-    rain_today = history['rain_mm'].iloc[-1]
     print(f"Date: {date.date()} | Today's Rain: {rain_today:>5.1f} mm | Prediction: {result_text} (Risk: {probability:.2f})")
 
 print("-" * 60)
\ No newline at end of file
@@ -0,0 +1,243 @@
+# spatial_grid.py
+# Interpolates node readings (rainfall and risk) onto a regular grid over the
+# Chennai bounding box and serves the result as cached PNG tiles.
+
+import struct
+import threading
+import zlib
+
+import numpy as np
+from scipy.sparse import csc_matrix
+from scipy.spatial import cKDTree
+
+# --- Grid Configuration ---
+# Same Chennai bounding box as train_from_imd_nc.py (that script trains on
+# import, so the values are repeated here rather than imported).
+LAT_MIN, LAT_MAX = 12.75, 13.25
+LON_MIN, LON_MAX = 79.8, 80.5
+
+GRID_ROWS = 256
+GRID_COLS = 256
+TILE_SIZE = 64
+IDW_POWER = 2.0
+# Each cell is interpolated from its nearest nodes only, keeping the weights sparse
+IDW_NEIGHBOURS = 8
+
+# Value that maps to a full-white pixel for each layer
+LAYER_SCALES = {
+    "risk": 1.0,
+    "rainfall": 100.0,  # mm/hr
+}
+
+# Approximate km per degree around Chennai's latitude
+KM_PER_DEG_LAT = 110.57
+KM_PER_DEG_LON = 111.32 * np.cos(np.radians((LAT_MIN + LAT_MAX) / 2))
+
+
+# --- PNG Encoding ---
+def _png_chunk(tag, data):
+    chunk = tag + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk) & 0xFFFFFFFF)
+
+
+def encode_png(pixels):
+    """Encodes a 2-D uint8 array as an 8-bit grayscale PNG."""
+    height, width = pixels.shape
+    # Every scanline is prefixed with filter type 0 (None)
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+# --- Risk Grid ---
+class RiskGrid:
+    """
+    Inverse-distance-weighted interpolation of node readings onto a fixed grid.
+
+    Each cell is weighted over its IDW_NEIGHBOURS nearest nodes, so the sparse
+    (cells x nodes) weight matrix holds at most cells x k entries whatever the
+    node count. It only depends on node positions, so it is built once and
+    reused until the set of nodes changes. When only readings change, the
+    affected columns are applied as a low-rank update and only the tiles whose
+    quantized pixels actually changed are dropped from the cache.
+    """
+
+    def __init__(self, rows=GRID_ROWS, cols=GRID_COLS, tile_size=TILE_SIZE, power=IDW_POWER,
+                 neighbours=IDW_NEIGHBOURS):
+        self.rows = rows
+        self.cols = cols
+        self.tile_size = tile_size
+        self.power = power
+        self.neighbours = neighbours
+
+        # Row 0 is the northern edge so the grid can be drawn as an image
+        lats = np.linspace(LAT_MAX, LAT_MIN, rows)
+        lons = np.linspace(LON_MIN, LON_MAX, cols)
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+        self._cell_lat = lat_grid.ravel()
+        self._cell_lon = lon_grid.ravel()
+
+        self._node_ids = ()
+        self._node_coords = None
+        self._weights = None
+        self._node_values = {layer: None for layer in LAYER_SCALES}
+        self._fields = {layer: None for layer in LAYER_SCALES}
+        self._tiles = {}
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def tile_rows(self):
+        return -(-self.rows // self.tile_size)
+
+    @property
+    def tile_cols(self):
+        return -(-self.cols // self.tile_size)
+
+    def _build_weights(self, coords):
+        """Builds the sparse, row-normalised IDW weights over each cell's nearest nodes."""
+        # Project to km so the KD-tree distances are isotropic
+        node_km = np.column_stack((coords[:, 0] * KM_PER_DEG_LAT, coords[:, 1] * KM_PER_DEG_LON))
+        cell_km = np.column_stack((self._cell_lat * KM_PER_DEG_LAT, self._cell_lon * KM_PER_DEG_LON))
+        k = min(self.neighbours, len(coords))
+        dist, idx = cKDTree(node_km).query(cell_km, k=k)
+        dist = dist.reshape(len(cell_km), k)
+        idx = idx.reshape(len(cell_km), k)
+
+        with np.errstate(divide="ignore"):
+            weights = 1.0 / np.power(dist, self.power)
+
+        # A cell sitting exactly on a node takes that node's value
+        exact = dist < 1e-9
+        hit_rows = exact.any(axis=1)
+        weights[hit_rows] = exact[hit_rows].astype(float)
+
+        weights /= weights.sum(axis=1, keepdims=True)
+        rows = np.repeat(np.arange(len(cell_km)), k)
+        # Column-compressed so reading updates can slice the affected node columns
+        return csc_matrix((weights.ravel(), (rows, idx.ravel())), shape=(len(cell_km), len(coords)))
+
+    def _quantize(self, layer, field):
+        scaled = np.clip(field / LAYER_SCALES[layer], 0.0, 1.0) * 255.0
+        return np.rint(scaled).astype(np.uint8).reshape(self.rows, self.cols)
+
+    def _changed_tiles(self, layer, old_field, new_field):
+        """Returns the (tile_row, tile_col) keys whose pixels differ between two fields."""
+        diff = self._quantize(layer, old_field) != self._quantize(layer, new_field)
+        changed = []
+        for tr in range(self.tile_rows):
+            for tc in range(self.tile_cols):
+                block = diff[
+                    tr * self.tile_size:(tr + 1) * self.tile_size,
+                    tc * self.tile_size:(tc + 1) * self.tile_size,
+                ]
+                if block.any():
+                    changed.append((tr, tc))
+        return changed
+
+    def update(self, readings):
+        """
+        Refreshes the grid from node readings.
+
+        `readings` maps node_id -> {"lat", "lon", "rainfall", "risk"}. Nodes
+        without a position are ignored. Returns the number of tiles invalidated.
+        """
+        located = {
+            node_id: r for node_id, r in readings.items()
+            if r.get("lat") is not None and r.get("lon") is not None
+        }
+        node_ids = tuple(sorted(located))
+        coords = np.array(
+            [[float(located[n]["lat"]), float(located[n]["lon"])] for n in node_ids]
+        ).reshape(-1, 2)
+        values = {
+            layer: np.array([float(located[n].get(layer) or 0.0) for n in node_ids])
+            for layer in LAYER_SCALES
+        }
+
+        with self._lock:
+            if not node_ids:
+                invalidated = len(self._tiles)
+                self._node_ids = ()
+                self._node_coords = None
+                self._weights = None
+                self._node_values = {layer: None for layer in LAYER_SCALES}
+                self._fields = {layer: None for layer in LAYER_SCALES}
+                self._tiles.clear()
+                self.version += 1
+                return invalidated
+
+            if node_ids != self._node_ids or not np.array_equal(coords, self._node_coords):
+                # Node set changed: rebuild the weights and regenerate everything
+                self._weights = self._build_weights(coords)
+                self._node_ids = node_ids
+                self._node_coords = coords
+                for layer, vals in values.items():
+                    self._node_values[layer] = vals
+                    self._fields[layer] = self._weights @ vals
+                invalidated = len(self._tiles)
+                self._tiles.clear()
+                self.version += 1
+                return invalidated
+
+            invalidated = 0
+            for layer, vals in values.items():
+                delta = vals - self._node_values[layer]
+                cols = np.flatnonzero(delta)
+                if cols.size == 0:
+                    continue
+                old_field = self._fields[layer]
+                new_field = old_field + self._weights[:, cols] @ delta[cols]
+                for tr, tc in self._changed_tiles(layer, old_field, new_field):
+                    if self._tiles.pop((layer, tr, tc), None) is not None:
+                        invalidated += 1
+                self._node_values[layer] = vals
+                self._fields[layer] = new_field
+
+            if invalidated:
+                self.version += 1
+            return invalidated
+
+    def tile(self, layer, tile_row, tile_col):
+        """Returns the PNG bytes for one tile, or None if it is out of range or empty."""
+        if layer not in LAYER_SCALES:
+            return None
+        if not (0 <= tile_row < self.tile_rows and 0 <= tile_col < self.tile_cols):
+            return None
+
+        key = (layer, tile_row, tile_col)
+        with self._lock:
+            cached = self._tiles.get(key)
+            if cached is not None:
+                return cached
+            field = self._fields[layer]
+            if field is None:
+                return None
+
+            pixels = self._quantize(layer, field)[
+                tile_row * self.tile_size:(tile_row + 1) * self.tile_size,
+                tile_col * self.tile_size:(tile_col + 1) * self.tile_size,
+            ]
+            png = encode_png(np.ascontiguousarray(pixels))
+            self._tiles[key] = png
+            return png
+
+    def metadata(self):
+        """Describes the grid so a client can place the tiles on a map."""
+        return {
+            "bbox": {"lat_min": LAT_MIN, "lat_max": LAT_MAX, "lon_min": LON_MIN, "lon_max": LON_MAX},
+            "rows": self.rows,
+            "cols": self.cols,
+            "tile_size": self.tile_size,
+            "tile_rows": self.tile_rows,
+            "tile_cols": self.tile_cols,
+            "layers": {layer: {"max_value": scale} for layer, scale in LAYER_SCALES.items()},
+            "nodes": list(self._node_ids),
+            "version": self.version,
+        }
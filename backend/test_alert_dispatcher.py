@@ -0,0 +1,19 @@
+# test_alert_dispatcher.py
+# Run with: python -m pytest -q test_alert_dispatcher.py
+
+from alert_dispatcher import CHANNEL_BANDS, CRITICAL_DEDUP_SECONDS, AlertPipeline
+
+
+def quiet_pipeline():
+    return AlertPipeline(sinks={channel: (lambda batch: None) for channel in CHANNEL_BANDS})
+
+
+def test_suppressed_critical_does_not_extend_the_dedup_window():
+    pipeline = quiet_pipeline()
+    assert pipeline.observe("drain_a01", 0.95, now=0) is not None
+    pipeline.observe("drain_a01", 0.6, now=60)
+    # Flapping back inside the window is suppressed
+    assert pipeline.observe("drain_a01", 0.95, now=120) is None
+    pipeline.observe("drain_a01", 0.6, now=180)
+    # The window runs from the last alert sent, not the last suppressed one
+    assert pipeline.observe("drain_a01", 0.95, now=CRITICAL_DEDUP_SECONDS + 1) is not None
@@ -0,0 +1,59 @@
+# test_drainage_network.py
+# Run with: python -m pytest -q test_drainage_network.py
+
+import pytest
+
+from drainage_network import DrainageNetwork
+
+
+def chain():
+    # a -> b -> c, plus d also draining into c
+    return DrainageNetwork.from_edges(["a", "b", "c", "d"], [
+        ("a", "b", 0.5, None),
+        ("b", "c", 1.0, None),
+        ("d", "c", 1.0, None),
+    ])
+
+
+def test_level_and_risk_propagate_downstream():
+    network = chain()
+    changed = network.update("a", water_level=40.0, risk=0.8)
+    assert changed == ["a", "b", "c"]
+
+    assert network.state("b")["network_water_level"] == 20.0
+    assert network.state("b")["network_risk"] == 0.4
+    assert network.state("c")["network_water_level"] == 20.0
+    # Upstream of the change is untouched
+    assert network.state("d")["network_water_level"] == 0.0
+
+
+def test_local_readings_add_to_inflow():
+    network = chain()
+    network.update("a", water_level=40.0)
+    network.update("d", water_level=10.0, risk=0.9)
+    network.update("c", water_level=5.0, risk=0.1)
+
+    state = network.state("c")
+    assert state["network_water_level"] == 35.0
+    assert state["network_risk"] == 0.9
+    assert sorted(state["upstream"]) == ["b", "d"]
+
+
+def test_update_without_change_stops_early():
+    network = chain()
+    network.update("a", water_level=40.0)
+    assert network.update("a", water_level=40.0) == []
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        DrainageNetwork.from_edges(["a", "b", "c"], [
+            ("a", "b", 1.0, None),
+            ("b", "c", 1.0, None),
+            ("c", "a", 1.0, None),
+        ])
+
+
+def test_resources_network_is_acyclic():
+    network = DrainageNetwork.from_resources()
+    assert len(network) > 0
@@ -0,0 +1,75 @@
+# test_edge.py
+# Run with: python -m pytest -q test_edge.py
+
+import os
+
+import pytest
+
+os.environ["BACKGROUND_SCORING"] = "0"
+
+import server  # noqa: E402
+from edge_scorer import CompactForest, EdgeScorer  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    server.edge_results.clear()
+    server.edge_gateways.clear()
+    yield server.app.test_client()
+    server.edge_results.clear()
+    server.edge_gateways.clear()
+
+
+def change(risk_score, **overrides):
+    result = {"live_data": {"rainfall_mm_hr": 12.0, "water_level_cm": 30.0}, "risk_score": risk_score,
+              "history": [0, 0, 0, 0, 0, 6, 12]}
+    result.update(overrides)
+    return result
+
+
+def test_edge_changes_are_stored(client):
+    response = client.post("/edge", json={"gateway_id": "gw", "changes": {"n1": change(0.7), "n2": change(0.2)}})
+    assert response.status_code == 200
+    assert server.edge_results["n1"]["risk_score"] == 0.7
+    assert server.edge_results["n2"]["prediction"] == 0
+    assert "gw" in server.edge_gateways
+
+
+@pytest.mark.parametrize("bad", [
+    change(1.5),
+    change(0.5, history="12"),
+    change(0.5, live_data={"rainfall_mm_hr": -1}),
+    change("high"),
+])
+def test_one_bad_change_leaves_state_untouched(client, bad):
+    client.post("/edge", json={"gateway_id": "gw", "changes": {"n1": change(0.3)}})
+    before = dict(server.edge_results)
+    version = server.data_version
+
+    response = client.post("/edge", json={"gateway_id": "gw", "changes": {"n1": change(0.9), "n2": bad}})
+    assert response.status_code == 400
+    assert server.edge_results == before
+    assert server.data_version == version
+
+
+def test_scorer_drops_redelivered_readings():
+    scorer = EdgeScorer(CompactForest())
+    assert scorer.add({"node_id": "n", "rainfall_mm_hr": 5.0, "timestamp": 1})
+    assert not scorer.add({"node_id": "n", "rainfall_mm_hr": 5.0, "timestamp": 1})
+    results, _ = scorer.flush()
+    assert results["n"]["history"][-2:] == [0.0, 5.0]
+
+
+def test_scorer_resends_until_marked_sent():
+    scorer = EdgeScorer(CompactForest())
+    scorer.add({"node_id": "drain_a01", "rainfall_mm_hr": 60.0, "timestamp": 1})
+    _, changes = scorer.flush()
+    assert changes["drain_a01"]["band"] == "critical"
+
+    # The send failed, so the change comes back with the next flush
+    _, changes = scorer.flush()
+    assert list(changes) == ["drain_a01"]
+
+    scorer.mark_sent(changes)
+    _, changes = scorer.flush()
+    assert changes == {}
@@ -0,0 +1,76 @@
+# test_ingest.py
+# Run with: python -m pytest -q test_ingest.py
+
+import pytest
+
+from ingest import IngestError, SensorIngest
+
+
+def replay(ingest, node_id, values):
+    """Feeds rainfall readings through the ingest stage and rebuilds the stored history."""
+    history = []
+    for i, value in enumerate(values):
+        record = ingest.accept({"node_id": node_id, "rainfall_mm_hr": value, "timestamp": i})
+        if "replaces_previous" in record:
+            history[-1] = record["replaces_previous"]
+        history.append(record["rainfall_mm_hr"])
+    return history
+
+
+def test_step_change_is_kept():
+    # A storm starting must not be flattened to the dry-weather median
+    history = replay(SensorIngest(), "step", [0, 0, 0, 0, 0, 60, 60, 60])
+    assert history == [0, 0, 0, 0, 0, 60, 60, 60]
+
+
+def test_demo_pattern_is_kept():
+    pattern = [0.0, 5.0, 15.0, 45.0, 60.0, 25.0, 10.0, 0.0, 0.0]
+    assert replay(SensorIngest(), "demo", pattern) == pattern
+
+
+def test_single_spike_is_corrected_once_it_falls_back():
+    ingest = SensorIngest()
+    for i, value in enumerate([2, 2, 3, 2]):
+        ingest.accept({"node_id": "spike", "rainfall_mm_hr": value, "timestamp": i})
+
+    spike = ingest.accept({"node_id": "spike", "rainfall_mm_hr": 300, "timestamp": 4})
+    # Kept raw for scoring, only flagged
+    assert spike["rainfall_mm_hr"] == 300
+    assert spike["spike_suspect"] is True
+    assert spike["rolling_median"] == 2
+
+    after = ingest.accept({"node_id": "spike", "rainfall_mm_hr": 3, "timestamp": 5})
+    assert after["replaces_previous"] == 2
+    assert after["rainfall_mm_hr"] == 3
+    assert ingest.stats["filtered"] == 1
+
+
+def test_spike_in_history_is_replaced():
+    history = replay(SensorIngest(), "spike", [2, 2, 3, 2, 300, 3, 2])
+    assert history == [2, 2, 3, 2, 2, 3, 2]
+
+
+def test_null_optional_fields_are_dropped():
+    record = SensorIngest().accept({"node_id": "drain_a01", "rainfall_mm_hr": 1, "water_level_cm": None, "lat": None})
+    assert "water_level_cm" not in record
+    assert "lat" not in record
+
+
+def test_null_rainfall_is_rejected():
+    with pytest.raises(IngestError):
+        SensorIngest().accept({"node_id": "drain_a01", "rainfall_mm_hr": None})
+
+
+def test_identical_reading_without_timestamp_is_a_duplicate():
+    ingest = SensorIngest()
+    reading = {"node_id": "drain_a01", "rainfall_mm_hr": 12.5, "water_level_cm": 40}
+    assert ingest.accept(dict(reading), now=100) is not None
+    assert ingest.accept(dict(reading), now=101) is None
+    # Outside the window the same values are a new reading
+    assert ingest.accept(dict(reading), now=1000) is not None
+
+
+def test_out_of_order_timestamp_is_a_duplicate():
+    ingest = SensorIngest()
+    assert ingest.accept({"node_id": "n", "rainfall_mm_hr": 1, "timestamp": 10}) is not None
+    assert ingest.accept({"node_id": "n", "rainfall_mm_hr": 2, "timestamp": 9}) is None
@@ -0,0 +1,58 @@
+# test_spatial_grid.py
+# Run with: python -m pytest -q test_spatial_grid.py
+
+import numpy as np
+
+from spatial_grid import LAYER_SCALES, RiskGrid
+
+
+def readings(rng, n_nodes):
+    return {
+        f"node_{i}": {
+            "lat": 12.75 + rng.random() * 0.5,
+            "lon": 79.8 + rng.random() * 0.7,
+            "rainfall": rng.random() * 60.0,
+            "risk": rng.random(),
+        }
+        for i in range(n_nodes)
+    }
+
+
+def test_incremental_update_matches_rebuild():
+    rng = np.random.default_rng(0)
+    current = readings(rng, 40)
+    grid = RiskGrid(rows=64, cols=64, tile_size=16)
+    grid.update(current)
+
+    # New readings at the same positions take the incremental path
+    for node_id in ["node_3", "node_17", "node_30"]:
+        current[node_id] = dict(current[node_id], rainfall=95.0, risk=0.9)
+    grid.update(current)
+
+    rebuilt = RiskGrid(rows=64, cols=64, tile_size=16)
+    rebuilt.update(current)
+    for layer in LAYER_SCALES:
+        np.testing.assert_allclose(grid._fields[layer], rebuilt._fields[layer], atol=1e-9)
+
+
+def test_unchanged_readings_invalidate_nothing():
+    rng = np.random.default_rng(1)
+    current = readings(rng, 10)
+    grid = RiskGrid(rows=64, cols=64, tile_size=16)
+    grid.update(current)
+    assert grid.tile("risk", 0, 0) is not None
+
+    version = grid.version
+    assert grid.update(current) == 0
+    assert grid.version == version
+
+
+def test_cell_on_a_node_takes_its_value():
+    grid = RiskGrid(rows=3, cols=3, tile_size=3)
+    grid.update({
+        "nw": {"lat": 13.25, "lon": 79.8, "rainfall": 0.0, "risk": 1.0},
+        "se": {"lat": 12.75, "lon": 80.5, "rainfall": 0.0, "risk": 0.0},
+    })
+    field = grid._fields["risk"].reshape(3, 3)
+    assert field[0, 0] == 1.0
+    assert field[2, 2] == 0.0